@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+Throughput benchmark for parse_multi_step_instruction
+Runs the instruction corpus cold (cache cleared every pass) and warm (cached),
+plus micro-benchmarks of the parser's building blocks
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from instruction_parser import (  # noqa: E402
+    clear_parse_cache,
+    find_keywords,
+    normalize_instruction,
+    parse_multi_step_instruction,
+)
+
+CORPUS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'instructions.txt')
+
+
+def load_corpus(path=CORPUS_PATH):
+    """Load one instruction per non-empty line"""
+    with open(path) as f:
+        return [line.strip() for line in f if line.strip()]
+
+
+def run_pass(corpus, rounds, cold):
+    """Parse the corpus `rounds` times and return parses per second"""
+    start = time.perf_counter()
+    for _ in range(rounds):
+        if cold:
+            clear_parse_cache()
+        for instruction in corpus:
+            parse_multi_step_instruction(instruction)
+    elapsed = time.perf_counter() - start
+    return (rounds * len(corpus)) / elapsed
+
+
+def run_micro(func, inputs, rounds):
+    """Call func on every input `rounds` times and return calls per second"""
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for value in inputs:
+            func(value)
+    elapsed = time.perf_counter() - start
+    return (rounds * len(inputs)) / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rounds', type=int, default=2000)
+    parser.add_argument('--corpus', default=CORPUS_PATH)
+    parser.add_argument('--json', dest='json_out', help='write the rates to this file')
+    args = parser.parse_args()
+
+    corpus = load_corpus(args.corpus)
+    print(f"Corpus: {len(corpus)} instructions, {args.rounds} rounds")
+
+    cold = run_pass(corpus, args.rounds, cold=True)
+    print(f"cold (uncached): {cold:,.0f} parses/s  ({1e6 / cold:.2f} us/parse)")
+
+    warm = run_pass(corpus, args.rounds, cold=False)
+    print(f"warm (cached):   {warm:,.0f} parses/s  ({1e6 / warm:.2f} us/parse)")
+
+    normalized = [normalize_instruction(instruction) for instruction in corpus]
+    rates = {"parse_cold": cold, "parse_warm": warm}
+    rates["normalize_instruction"] = run_micro(normalize_instruction, corpus, args.rounds)
+    rates["find_keywords"] = run_micro(find_keywords, normalized, args.rounds)
+    for name in ("normalize_instruction", "find_keywords"):
+        print(f"{name + ':':<22} {rates[name]:,.0f} calls/s  ({1e6 / rates[name]:.2f} us/call)")
+
+    if args.json_out:
+        with open(args.json_out, 'w') as f:
+            json.dump({"corpus": len(corpus), "rounds": args.rounds, "per_second": rates}, f, indent=2)
+        print(f"Wrote {args.json_out}")
+
+
+if __name__ == "__main__":
+    main()
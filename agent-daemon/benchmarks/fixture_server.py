@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+"""
+Local stand-in sites for offline benchmarks
+Serves search and results pages shaped like the DOM the daemon drives, and
+writes a site table that points every known site at them
+"""
+
+import argparse
+import asyncio
+import base64
+import html
+import json
+import os
+import sys
+from urllib.parse import quote_plus
+
+from aiohttp import web
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from site_registry import SITES_PATH  # noqa: E402
+
+RESULTS_PER_PAGE = 10
+
+# 1x1 transparent PNG, served as every result thumbnail
+PIXEL_PNG = base64.b64decode(
+    'iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAQAAAC1HAwCAAAAC0lEQVR42mNkYAAAAAYAAjCB0C8AAAAASUVORK5CYII='
+)
+
+# Sites with a dedicated fixture keep their real selectors; the rest use the generic one
+FIXTURES = {
+    'google.com': {'base': '/google/', 'search': '/google/search?q={q}'},
+    'amazon.com': {'base': '/amazon/', 'search': '/amazon/s?k={q}'},
+}
+
+PAGE = """<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>{title}</title></head>
+<body>{body}</body></html>"""
+
+GOOGLE_HOME = """
+<form action="/google/search" id="tsf">
+  <textarea name="q" title="Search" rows="1"></textarea>
+</form>
+<script>
+  // Enter submits, as on the real page
+  document.querySelector('textarea[name="q"]').addEventListener('keydown', (event) => {
+    if (event.key === 'Enter') { event.preventDefault(); document.getElementById('tsf').submit(); }
+  });
+</script>"""
+
+GOOGLE_RESULT = """
+<div class="g" data-hveid="{rank}">
+  <div class="yuRUbf"><a href="/page/google.com/{rank}?q={q_param}"><h3>{title}</h3></a></div>
+  <img src="/img/{rank}.png" width="92" height="92" alt="">
+  <div class="VwiC3b">{snippet}</div>
+</div>"""
+
+AMAZON_HOME = """
+<form action="/amazon/s" name="site-search">
+  <input type="text" id="twotabsearchtextbox" name="field-keywords" placeholder="Search Amazon">
+</form>"""
+
+AMAZON_RESULT = """
+<div data-component-type="s-search-result" data-index="{rank}">
+  <img src="/img/{rank}.png" width="218" height="218" alt="">
+  <h2><a href="/page/amazon.com/{rank}?q={q_param}"><span>{title}</span></a></h2>
+  <span class="a-price">${price}</span>
+  <p>{snippet}</p>
+</div>"""
+
+GENERIC_HOME = """
+<header><form action="search"><input type="search" name="q" placeholder="Search {site}"></form></header>
+<main><p>Welcome to the {site} stand-in.</p></main>"""
+
+GENERIC_RESULT = """
+<article>
+  <a href="/page/{site}/{rank}?q={q_param}"><h3>{title}</h3></a>
+  <img src="/img/{rank}.png" width="120" height="90" alt="">
+  <p>{snippet}</p>
+</article>"""
+
+
+def _results(template, site, query, **extra):
+    items = []
+    for rank in range(1, RESULTS_PER_PAGE + 1):
+        items.append(template.format(
+            rank=rank,
+            site=site,
+            q_param=html.escape(quote_plus(query), quote=True),
+            title=html.escape(f"{query} - result {rank} on {site}"),
+            snippet=html.escape(f"Stand-in snippet {rank} for '{query}'. " * 3),
+            price=f"{19.99 + rank * 10:.2f}",
+            **extra,
+        ))
+    return ''.join(items)
+
+
+def _page(title, body):
+    return web.Response(text=PAGE.format(title=html.escape(title), body=body), content_type='text/html')
+
+
+def create_app(delay_ms=0):
+    """aiohttp app serving the fixture pages, optionally delaying every response"""
+
+    @web.middleware
+    async def latency(request, handler):
+        if delay_ms:
+            await asyncio.sleep(delay_ms / 1000)
+        return await handler(request)
+
+    async def google_home(request):
+        return _page('Google', GOOGLE_HOME)
+
+    async def google_search(request):
+        query = request.query.get('q', '')
+        body = GOOGLE_HOME + f'<div id="search">{_results(GOOGLE_RESULT, "google.com", query)}</div>'
+        return _page(f"{query} - Google Search", body)
+
+    async def amazon_home(request):
+        return _page('Amazon.com', AMAZON_HOME)
+
+    async def amazon_search(request):
+        query = request.query.get('k', '')
+        body = AMAZON_HOME + f'<div class="s-main-slot">{_results(AMAZON_RESULT, "amazon.com", query)}</div>'
+        return _page(f"Amazon.com : {query}", body)
+
+    async def generic_home(request):
+        site = request.match_info['site']
+        return _page(site, GENERIC_HOME.format(site=html.escape(site)))
+
+    async def generic_search(request):
+        site = request.match_info['site']
+        query = request.query.get('q', '')
+        body = GENERIC_HOME.format(site=html.escape(site)).replace(
+            '<main>', f'<main>{_results(GENERIC_RESULT, html.escape(site), query)}', 1
+        )
+        return _page(f"{query} - {site}", body)
+
+    async def result_page(request):
+        site = request.match_info['site']
+        rank = request.match_info['rank']
+        return _page(f"Result {rank} on {site}", f"<main><h1>Result {rank}</h1><p>Destination page on {html.escape(site)}.</p></main>")
+
+    async def image(request):
+        return web.Response(body=PIXEL_PNG, content_type='image/png')
+
+    app = web.Application(middlewares=[latency])
+    app.router.add_get('/google/', google_home)
+    app.router.add_get('/google/search', google_search)
+    app.router.add_get('/amazon/', amazon_home)
+    app.router.add_get('/amazon/s', amazon_search)
+    app.router.add_get('/generic/{site}/', generic_home)
+    app.router.add_get('/generic/{site}/search', generic_search)
+    app.router.add_get('/page/{site}/{rank}', result_page)
+    app.router.add_get('/img/{name}', image)
+    return app
+
+
+async def start_fixture_server(host='127.0.0.1', port=8765, delay_ms=0):
+    """Start the fixture server on the running loop; returns its AppRunner"""
+    runner = web.AppRunner(create_app(delay_ms))
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    return runner
+
+
+def write_sites_file(base_url, path, source=SITES_PATH):
+    """
+    Write a copy of the site table with every site pointed at the fixture server.
+
+    Google and Amazon keep their real selectors against look-alike pages;
+    every other site is served by the generic fixture and falls back to the
+    default selectors.
+    """
+    with open(source) as f:
+        table = json.load(f)
+
+    base_url = base_url.rstrip('/')
+    for entry in table['sites']:
+        fixture = FIXTURES.get(entry['domain'])
+        if fixture is None:
+            fixture = {
+                'base': f"/generic/{entry['domain']}/",
+                'search': f"/generic/{entry['domain']}/search?q={{q}}",
+            }
+            entry.pop('search_selectors', None)
+            entry.pop('result_selectors', None)
+        entry['base_url'] = base_url + fixture['base']
+        entry['search_url'] = base_url + fixture['search']
+
+    with open(path, 'w') as f:
+        json.dump(table, f, indent=2)
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--delay-ms', type=float, default=0, help='latency added to every response')
+    parser.add_argument('--sites-out', default='fixture_sites.json',
+                        help='site table to write; start the daemon with AGENT_SITES_PATH pointing at it')
+    args = parser.parse_args()
+
+    write_sites_file(f"http://{args.host}:{args.port}", args.sites_out)
+    print(f"Wrote {args.sites_out}; start the daemon with AGENT_SITES_PATH={os.path.abspath(args.sites_out)}")
+    web.run_app(create_app(args.delay_ms), host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
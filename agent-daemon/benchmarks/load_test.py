@@ -0,0 +1,271 @@
+#!/usr/bin/env python3
+"""
+Load generator for the agent daemon
+Drives /agent/run at several concurrency levels against the local stand-in
+sites and reports latency percentiles, throughput and memory
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import math
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import aiohttp
+
+try:
+    import psutil
+except ImportError:  # memory is reported as n/a without psutil
+    psutil = None
+
+from bench_parser import CORPUS_PATH, load_corpus
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+SERVER_SCRIPT = os.path.join(os.path.dirname(BENCH_DIR), 'simple_server.py')
+FIXTURE_SCRIPT = os.path.join(BENCH_DIR, 'fixture_server.py')
+
+STARTUP_TIMEOUT = 60
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, math.ceil(fraction * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def process_tree_rss_mb(process):
+    """Resident memory of a process and all its descendants (daemon, driver, Chromium), in MB"""
+    if psutil is None or process is None:
+        return None
+    try:
+        root = psutil.Process(process.pid)
+        total = root.memory_info().rss
+        for child in root.children(recursive=True):
+            try:
+                total += child.memory_info().rss
+            except psutil.Error:
+                continue
+    except psutil.Error:
+        return None
+    return total / (1024 * 1024)
+
+
+async def wait_until_up(session, url, timeout=STARTUP_TIMEOUT):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            async with session.get(url, timeout=aiohttp.ClientTimeout(total=2)) as response:
+                if response.status == 200:
+                    return
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            pass
+        await asyncio.sleep(0.5)
+    raise RuntimeError(f"{url} did not come up within {timeout}s")
+
+
+def start_environment(args, max_concurrency):
+    """Spawn the fixture server and a headless daemon whose site table points at it"""
+    sites_path = os.path.join(tempfile.mkdtemp(prefix='agent-bench-'), 'fixture_sites.json')
+    fixture = subprocess.Popen(
+        [sys.executable, FIXTURE_SCRIPT, '--port', str(args.fixture_port),
+         '--delay-ms', str(args.fixture_delay_ms), '--sites-out', sites_path],
+        stdout=subprocess.DEVNULL,
+    )
+
+    env = dict(os.environ)
+    env.update({
+        'AGENT_SITES_PATH': sites_path,
+        'AGENT_BROWSER_HEADLESS': '1',
+        # Measure real runs, not cache replays or a selector memory left over from live sites
+        'AGENT_RESULT_CACHE_SIZE': '0',
+        'AGENT_SELECTOR_CACHE_PATH': '',
+        'AGENT_TASK_QUEUE_SIZE': env.get('AGENT_TASK_QUEUE_SIZE', str(max(16, max_concurrency * 2))),
+    })
+    log = open(os.path.join(os.path.dirname(sites_path), 'daemon.log'), 'w')
+    daemon = subprocess.Popen(
+        [sys.executable, SERVER_SCRIPT, '--port', str(args.port), '--workers', str(args.workers)],
+        env=env, stdout=log, stderr=subprocess.STDOUT,
+    )
+    print(f"Daemon log: {log.name}")
+    return fixture, daemon
+
+
+def stop_environment(*processes):
+    for process in processes:
+        if process is not None and process.poll() is None:
+            process.terminate()
+    for process in processes:
+        if process is not None:
+            try:
+                process.wait(timeout=20)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+
+async def run_level(session, daemon_url, instructions, concurrency, total, args, daemon):
+    """Send `total` tasks with `concurrency` in flight and summarize the latencies"""
+    latencies = []
+    outcomes = {}
+    peak_rss = None
+    pending = iter(range(total))
+
+    async def client():
+        for _ in pending:
+            body = {
+                "task": next(instructions),
+                "use_browser": True,
+                "wait": True,
+                "bypass_cache": True,
+                # The corpus repeats, and shared runs would flatter the numbers
+                "coalesce": False,
+                "latency_profile": args.latency_profile,
+            }
+            if args.block_resources:
+                body["block_resources"] = args.block_resources
+            start = time.perf_counter()
+            try:
+                async with session.post(f"{daemon_url}/agent/run", json=body) as response:
+                    reply = await response.json()
+                    status = response.status
+            except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+                outcomes[type(e).__name__] = outcomes.get(type(e).__name__, 0) + 1
+                continue
+            elapsed = time.perf_counter() - start
+
+            if status == 429:
+                outcome = 'rejected'
+            elif reply.get("task_status") is None and reply.get("task_id"):
+                outcome = 'unfinished'
+            else:
+                outcome = reply.get("result", {}).get("outcome") or reply.get("task_status") or reply.get("status")
+            outcomes[outcome] = outcomes.get(outcome, 0) + 1
+            if outcome == 'success':
+                latencies.append(elapsed)
+
+    async def sample_memory():
+        nonlocal peak_rss
+        while True:
+            rss = process_tree_rss_mb(daemon)
+            if rss is not None:
+                peak_rss = max(peak_rss or 0, rss)
+            await asyncio.sleep(0.5)
+
+    sampler = asyncio.create_task(sample_memory())
+    start = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    wall = time.perf_counter() - start
+    sampler.cancel()
+
+    latencies.sort()
+
+    def ms(value):
+        return round(value * 1000, 1) if value is not None else None
+
+    return {
+        "concurrency": concurrency,
+        "requests": total,
+        "succeeded": len(latencies),
+        "outcomes": outcomes,
+        "p50_ms": ms(percentile(latencies, 0.50)),
+        "p95_ms": ms(percentile(latencies, 0.95)),
+        "p99_ms": ms(percentile(latencies, 0.99)),
+        "throughput_per_s": round(len(latencies) / wall, 2),
+        "peak_rss_mb": round(peak_rss, 1) if peak_rss is not None else None,
+    }
+
+
+def compare_to_baseline(levels, baseline, tolerance):
+    """Regressions in p95 latency or throughput beyond tolerance, as printable lines"""
+    previous = {level["concurrency"]: level for level in baseline["levels"]}
+    regressions = []
+    for level in levels:
+        before = previous.get(level["concurrency"])
+        if not before:
+            continue
+        if before["p95_ms"] and level["p95_ms"] and level["p95_ms"] > before["p95_ms"] * (1 + tolerance):
+            regressions.append(f"c={level['concurrency']}: p95 {before['p95_ms']}ms -> {level['p95_ms']}ms")
+        if level["throughput_per_s"] < before["throughput_per_s"] * (1 - tolerance):
+            regressions.append(
+                f"c={level['concurrency']}: throughput {before['throughput_per_s']}/s -> {level['throughput_per_s']}/s"
+            )
+    return regressions
+
+
+async def run(args):
+    levels = [int(level) for level in args.concurrency.split(',')]
+    instructions = itertools.cycle(load_corpus(args.corpus))
+
+    fixture = daemon = None
+    daemon_url = args.daemon_url
+    if not daemon_url:
+        fixture, daemon = start_environment(args, max(levels))
+        daemon_url = f"http://127.0.0.1:{args.port}"
+
+    results = []
+    try:
+        timeout = aiohttp.ClientTimeout(total=args.request_timeout)
+        async with aiohttp.ClientSession(timeout=timeout) as session:
+            await wait_until_up(session, f"{daemon_url}/health")
+
+            # Launch the browser(s) and fill the pool before anything is timed
+            await run_level(session, daemon_url, instructions, max(levels), args.warmup, args, daemon)
+
+            print(f"{'conc':>5} {'ok':>5} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'tasks/s':>8} {'rss MB':>8}  outcomes")
+            for concurrency in levels:
+                level = await run_level(session, daemon_url, instructions, concurrency, args.requests, args, daemon)
+                results.append(level)
+                print(f"{level['concurrency']:>5} {level['succeeded']:>5} {level['p50_ms'] or '-':>9} "
+                      f"{level['p95_ms'] or '-':>9} {level['p99_ms'] or '-':>9} {level['throughput_per_s']:>8} "
+                      f"{level['peak_rss_mb'] or 'n/a':>8}  {level['outcomes']}")
+    finally:
+        stop_environment(daemon, fixture)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--daemon-url', help='benchmark an already running daemon instead of spawning one')
+    parser.add_argument('--port', type=int, default=4890, help='port for the spawned daemon')
+    parser.add_argument('--workers', type=int, default=1, help='worker processes for the spawned daemon')
+    parser.add_argument('--fixture-port', type=int, default=8765)
+    parser.add_argument('--fixture-delay-ms', type=float, default=0, help='latency added by the stand-in sites')
+    parser.add_argument('--concurrency', default='1,2,4,8', help='comma-separated concurrency levels')
+    parser.add_argument('--requests', type=int, default=40, help='tasks sent per concurrency level')
+    parser.add_argument('--warmup', type=int, default=8, help='untimed tasks sent before the first level')
+    parser.add_argument('--corpus', default=CORPUS_PATH)
+    parser.add_argument('--latency-profile', default='fast')
+    parser.add_argument('--block-resources')
+    parser.add_argument('--request-timeout', type=float, default=60)
+    parser.add_argument('--json', dest='json_out', help='write the results to this file')
+    parser.add_argument('--baseline', help='results file from an earlier run to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='allowed fractional p95/throughput regression against the baseline')
+    args = parser.parse_args()
+
+    levels = asyncio.run(run(args))
+
+    if args.json_out:
+        with open(args.json_out, 'w') as f:
+            json.dump({"created_at": time.time(), "args": vars(args), "levels": levels}, f, indent=2)
+        print(f"Wrote {args.json_out}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare_to_baseline(levels, json.load(f), args.tolerance)
+        if regressions:
+            print("Regressions against baseline:")
+            for line in regressions:
+                print(f"  {line}")
+            sys.exit(1)
+        print("No regressions against baseline")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""
+Browser lifecycle manager for the Orbit Agent Server
+Prewarms the shared browser at startup, recycles it on memory pressure and
+shuts it down when the daemon has been idle
+"""
+
+import asyncio
+import logging
+import os
+
+try:
+    import psutil
+except ImportError:  # RSS-based recycling is skipped without psutil
+    psutil = None
+
+logger = logging.getLogger(__name__)
+
+PREWARM = os.environ.get('AGENT_BROWSER_PREWARM', '1') not in ('0', 'false', 'no')
+IDLE_TIMEOUT = float(os.environ.get('AGENT_BROWSER_IDLE_TIMEOUT', '900'))
+MAX_RSS_MB = float(os.environ.get('AGENT_BROWSER_MAX_RSS_MB', '1500'))
+CHECK_INTERVAL = float(os.environ.get('AGENT_BROWSER_CHECK_INTERVAL', '15'))
+
+
+def browser_rss_mb():
+    """Resident memory of the Playwright driver and browser processes, in MB"""
+    if psutil is None:
+        return None
+    total = 0
+    for child in psutil.Process().children(recursive=True):
+        try:
+            total += child.memory_info().rss
+        except psutil.Error:
+            continue
+    return total / (1024 * 1024)
+
+
+class BrowserLifecycle:
+    """
+    Background owner of the pool's browser between requests.
+
+    Started and stopped from the FastAPI lifespan: launches the browser
+    without blocking startup, then periodically retires it when it has been
+    idle for `idle_timeout` seconds or its memory exceeds `max_rss_mb`.
+    A browser whose launch failed is retried on every check.
+    """
+
+    def __init__(self, pool, prewarm=PREWARM, idle_timeout=IDLE_TIMEOUT,
+                 max_rss_mb=MAX_RSS_MB, check_interval=CHECK_INTERVAL):
+        self.pool = pool
+        self.prewarm = prewarm
+        self.idle_timeout = idle_timeout
+        self.max_rss_mb = max_rss_mb
+        self.check_interval = check_interval
+        self.last_rss_mb = None
+        self._tasks = []
+
+    def start(self):
+        """Kick off prewarm and the monitor loop without waiting for either"""
+        if self.prewarm:
+            self._tasks.append(asyncio.create_task(self._prewarm()))
+        self._tasks.append(asyncio.create_task(self._monitor()))
+
+    async def _prewarm(self):
+        try:
+            await self.pool.start()
+            logger.info("Browser prewarmed and ready")
+        except Exception as e:
+            logger.warning(f"Browser prewarm failed, will launch on first task: {e}")
+
+    async def _monitor(self):
+        while True:
+            await asyncio.sleep(self.check_interval)
+            try:
+                await self.check()
+            except Exception as e:
+                logger.error(f"Browser lifecycle check failed: {e}")
+
+    async def check(self):
+        """Apply the idle-shutdown and memory-recycling policies once"""
+        if not self.pool.has_browser:
+            if self.pool.state == 'failed':
+                # Retry here: an unhealthy worker gets no tasks that would relaunch it
+                await self._prewarm()
+            return
+
+        if self.idle_timeout and self.pool.idle_seconds() > self.idle_timeout:
+            await self.pool.retire_browser(f"idle for {self.idle_timeout:.0f}s")
+            return
+
+        # While a retired browser drains, RSS covers both processes; wait it out
+        self.last_rss_mb = browser_rss_mb()
+        if self.max_rss_mb and self.last_rss_mb and not self.pool.retiring \
+                and self.last_rss_mb > self.max_rss_mb:
+            await self.pool.retire_browser(f"RSS {self.last_rss_mb:.0f}MB above {self.max_rss_mb:.0f}MB")
+
+    def health(self):
+        """'unhealthy' when the browser cannot be launched, 'degraded' until a lost browser is relaunched"""
+        if self.pool.state == 'failed':
+            return 'unhealthy'
+        if self.pool.state == 'disconnected':
+            return 'degraded'
+        return 'healthy'
+
+    def stats(self):
+        """Browser state for /health"""
+        stats = self.pool.stats()
+        stats["rss_mb"] = round(self.last_rss_mb, 1) if self.last_rss_mb is not None else None
+        stats["idle_timeout"] = self.idle_timeout
+        return stats
+
+    async def stop(self):
+        """Stop background work and close the browser"""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        await self.pool.close()
@@ -0,0 +1,384 @@
+"""
+Browser pool for the Orbit Agent Server
+Shares one Chromium process across isolated contexts/pages leased per task
+"""
+
+import asyncio
+import itertools
+import logging
+import os
+import time
+from contextlib import asynccontextmanager
+
+from playwright.async_api import async_playwright
+
+from browser_profile import BrowserProfile
+
+logger = logging.getLogger(__name__)
+
+POOL_SIZE = int(os.environ.get('AGENT_BROWSER_POOL_SIZE', '4'))
+ACQUIRE_TIMEOUT = float(os.environ.get('AGENT_BROWSER_ACQUIRE_TIMEOUT', '30'))
+MAX_TASKS_PER_BROWSER = int(os.environ.get('AGENT_BROWSER_MAX_TASKS', '200'))
+HEADLESS = os.environ.get('AGENT_BROWSER_HEADLESS', '0') not in ('0', 'false', 'no')
+# Seconds allowed to blank a cancelled task's page before its context is replaced instead
+RESET_TIMEOUT = 5
+# Longest a relaunch on a persistent profile waits for the retired browser to release it
+PROFILE_HANDOVER_TIMEOUT = 30
+
+USER_AGENT = 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36'
+
+LAUNCH_ARGS = [
+    '--disable-blink-features=AutomationControlled',
+    '--disable-web-security',
+    '--disable-features=VizDisplayCompositor'
+]
+
+# Script to remove webdriver detection
+STEALTH_SCRIPT = """
+    Object.defineProperty(navigator, 'webdriver', {
+        get: () => undefined,
+    });
+"""
+
+
+class PoolTimeoutError(Exception):
+    """Raised when no page could be leased within the acquire timeout"""
+
+
+class PooledPage:
+    """One browser context and its working page; with a persistent profile the context is shared"""
+
+    def __init__(self, slot_id, browser, context, page):
+        self.slot_id = slot_id
+        self.browser = browser
+        self.context = context
+        self.page = page
+        self.uses = 0
+        self.dirty = False
+
+
+class BrowserPool:
+    """
+    Fixed-size pool of browser contexts backed by a single Chromium process.
+
+    Each lease gets its own context, so concurrent tasks never share cookies,
+    history or a tab. Idle slots are handed out oldest-first and reset lazily
+    on their next lease, which keeps the last task's page on screen for the
+    user until that slot is needed again.
+
+    The browser is recycled after `max_tasks` leases. A retired browser stops
+    receiving new leases and is closed once its last lease is returned, while
+    a replacement is launched on demand.
+
+    With a persistent `profile`, Chromium is launched on that user-data
+    directory so its HTTP cache, cookies and service workers survive
+    relaunches and restarts. All slots are then pages of the one persistent
+    context: tasks share cookies and cache, and `task_scope` gives the page
+    itself as the unit to route and observe. A relaunch waits for the
+    retired browser to exit, because Chromium locks the directory.
+    """
+
+    def __init__(self, size=POOL_SIZE, acquire_timeout=ACQUIRE_TIMEOUT, headless=HEADLESS, max_tasks=MAX_TASKS_PER_BROWSER,
+                 profile=None):
+        self.size = size
+        self.acquire_timeout = acquire_timeout
+        self.headless = headless
+        self.max_tasks = max_tasks
+        self.profile = profile if profile is not None else BrowserProfile()
+        self.state = 'stopped'
+        self.launches = 0
+        self.tasks_since_launch = 0
+        self.last_used = time.monotonic()
+        self.last_retire_reason = None
+        self._playwright = None
+        self._browser = None
+        self._retiring = set()
+        self._retired_closed = asyncio.Event()
+        self._retired_closed.set()
+        # Pages a persistent context opened at launch, handed to the first slots
+        self._launch_pages = []
+        self._launch_lock = asyncio.Lock()
+        self._slot_ids = itertools.count(1)
+        self._leased = set()
+        # Queue entries are idle slots, or None for capacity not yet materialised
+        self._idle = asyncio.Queue()
+        for _ in range(size):
+            self._idle.put_nowait(None)
+
+    async def start(self):
+        """Start Playwright and launch the shared browser"""
+        return await self._ensure_browser()
+
+    async def _ensure_browser(self):
+        """Return the shared browser, launching it if there is none"""
+        if self._browser is not None:
+            return self._browser
+
+        async with self._launch_lock:
+            if self._browser is not None:
+                return self._browser
+
+            logger.info("Launching shared browser for pool")
+            self.state = 'starting'
+            try:
+                if not self._playwright:
+                    self._playwright = await async_playwright().start()
+
+                if self.profile.enabled:
+                    browser = await self._launch_persistent()
+                else:
+                    browser = await self._playwright.chromium.launch(
+                        headless=self.headless,
+                        args=LAUNCH_ARGS
+                    )
+                    # Liveness comes from Playwright's disconnect event, not from probing pages
+                    browser.on('disconnected', self._on_disconnected)
+            except Exception:
+                self.state = 'failed'
+                raise
+
+            self._browser = browser
+            self.state = 'ready'
+            self.launches += 1
+            self.tasks_since_launch = 0
+            return browser
+
+    async def _launch_persistent(self):
+        """Launch Chromium on the profile directory; returns its persistent context, used in place of a browser"""
+        await self._wait_for_retired()
+        await asyncio.to_thread(self.profile.prepare)
+        context = await self._playwright.chromium.launch_persistent_context(
+            self.profile.path,
+            headless=self.headless,
+            args=LAUNCH_ARGS + self.profile.launch_args(),
+            user_agent=USER_AGENT,
+        )
+        await context.add_init_script(STEALTH_SCRIPT)
+        # A persistent context has no separate browser object; its close event means Chromium is gone
+        context.on('close', self._on_disconnected)
+        self._launch_pages = list(context.pages)
+        logger.info(f"Browser using persistent profile {self.profile.path}")
+        return context
+
+    async def _wait_for_retired(self):
+        """Wait for retired browsers to exit and release the profile, closing them if they take too long"""
+        if not self._retiring:
+            return
+        logger.info("Waiting for the retired browser to release the profile")
+        try:
+            await asyncio.wait_for(self._retired_closed.wait(), PROFILE_HANDOVER_TIMEOUT)
+        except asyncio.TimeoutError:
+            logger.warning("Retired browser still busy; closing it to free the profile")
+            for browser in list(self._retiring):
+                self._retiring.discard(browser)
+                try:
+                    await browser.close()
+                except Exception as e:
+                    logger.debug(f"Error closing retired browser: {e}")
+
+    @property
+    def shared_context(self):
+        """True when every slot's page lives in one persistent context"""
+        return self.profile.enabled
+
+    def task_scope(self, page):
+        """What a task's routes and request listeners attach to: its own context, or its page in a shared one"""
+        return page if self.shared_context else page.context
+
+    def _on_disconnected(self, browser):
+        """Forget a browser that crashed, was closed by the user, or was retired"""
+        self._retiring.discard(browser)
+        if not self._retiring:
+            self._retired_closed.set()
+        if browser is self._browser:
+            logger.warning("Shared browser disconnected; it will be relaunched on the next task")
+            self._browser = None
+            self.state = 'disconnected'
+
+    async def retire_browser(self, reason):
+        """Stop leasing the current browser and close it once its leases are returned"""
+        if self._browser is None:
+            return
+        logger.info(f"Retiring shared browser: {reason}")
+        self._retiring.add(self._browser)
+        self._retired_closed.clear()
+        self._browser = None
+        self.state = 'stopped'
+        self.last_retire_reason = reason
+        await self._close_retired()
+
+    async def _close_retired(self):
+        """Close retired browsers that no longer have leased pages"""
+        busy = {slot.browser for slot in self._leased}
+        for browser in list(self._retiring):
+            if browser in busy:
+                continue
+            self._retiring.discard(browser)
+            try:
+                await browser.close()
+            except Exception as e:
+                logger.debug(f"Error closing retired browser: {e}")
+        if not self._retiring:
+            self._retired_closed.set()
+
+    async def _new_slot(self, browser):
+        """Create a fresh context and page on the shared browser, or a new page in the persistent context"""
+        if self.shared_context:
+            page = self._launch_pages.pop() if self._launch_pages else await browser.new_page()
+            slot = PooledPage(next(self._slot_ids), browser, browser, page)
+            logger.info(f"Created pooled page #{slot.slot_id} in the persistent context")
+            return slot
+
+        context = await browser.new_context(user_agent=USER_AGENT)
+        await context.add_init_script(STEALTH_SCRIPT)
+        page = await context.new_page()
+        slot = PooledPage(next(self._slot_ids), browser, context, page)
+        logger.info(f"Created pooled browser context #{slot.slot_id}")
+        return slot
+
+    async def _close_slot(self, slot):
+        """Close a slot's context (just its page in a shared one), ignoring errors from an already-dead browser"""
+        try:
+            if slot.context is slot.browser:
+                await slot.page.close()
+            else:
+                await slot.context.close()
+        except Exception as e:
+            logger.debug(f"Error closing pooled context #{slot.slot_id}: {e}")
+
+    async def _reset_slot(self, slot):
+        """Return a previously used slot to a clean single blank page"""
+        for extra_page in slot.context.pages:
+            if extra_page is slot.page:
+                continue
+            # In a shared persistent context only this slot's popups are its to close
+            if slot.context is slot.browser and await extra_page.opener() is not slot.page:
+                continue
+            await extra_page.close()
+        if slot.page.is_closed():
+            slot.page = await slot.context.new_page()
+        await slot.page.goto('about:blank')
+        slot.dirty = False
+
+    async def _prepare_slot(self, slot):
+        """Turn a queue entry into a ready-to-use slot"""
+        browser = await self._ensure_browser()
+        if slot is not None and slot.browser is not browser:
+            # Left over from a retired or crashed browser
+            slot = None
+
+        if slot is not None and slot.dirty:
+            try:
+                await self._reset_slot(slot)
+            except Exception as e:
+                logger.info(f"Pooled context #{slot.slot_id} could not be reset, replacing it: {e}")
+                await self._close_slot(slot)
+                slot = None
+
+        if slot is None:
+            slot = await self._new_slot(browser)
+        return slot
+
+    async def acquire(self, timeout=None):
+        """Lease a slot, waiting up to `timeout` seconds for one to free up"""
+        timeout = self.acquire_timeout if timeout is None else timeout
+        try:
+            entry = await asyncio.wait_for(self._idle.get(), timeout=timeout)
+        except asyncio.TimeoutError:
+            raise PoolTimeoutError(f"No browser page available within {timeout}s") from None
+
+        try:
+            slot = await self._prepare_slot(entry)
+        except BaseException:
+            # Give the capacity back so a failed launch does not shrink the pool
+            self._idle.put_nowait(None)
+            raise
+
+        slot.uses += 1
+        self.tasks_since_launch += 1
+        self.last_used = time.monotonic()
+        self._leased.add(slot)
+        return slot
+
+    async def release(self, slot, discard=False):
+        """Return a leased slot; discarded slots are closed and rebuilt on demand"""
+        self._leased.discard(slot)
+        self.last_used = time.monotonic()
+        if discard or slot.browser is not self._browser:
+            await self._close_slot(slot)
+            self._idle.put_nowait(None)
+        else:
+            slot.dirty = True
+            self._idle.put_nowait(slot)
+
+        if self._browser is not None and self.tasks_since_launch >= self.max_tasks:
+            await self.retire_browser(f"recycled after {self.tasks_since_launch} tasks")
+        elif self._retiring:
+            await self._close_retired()
+
+    @asynccontextmanager
+    async def lease(self, timeout=None):
+        """Async context manager yielding an isolated page for one task"""
+        slot = await self.acquire(timeout)
+        discard = False
+        try:
+            yield slot.page
+        except asyncio.CancelledError:
+            # Stop the abandoned page's navigation and requests now, not when the slot is next leased
+            try:
+                await asyncio.wait_for(self._reset_slot(slot), RESET_TIMEOUT)
+            except Exception as e:
+                logger.info(f"Pooled context #{slot.slot_id} could not be reset after cancellation, replacing it: {e}")
+                discard = True
+            raise
+        finally:
+            await self.release(slot, discard=discard)
+
+    @property
+    def leased(self):
+        return len(self._leased)
+
+    @property
+    def has_browser(self):
+        return self._browser is not None
+
+    @property
+    def retiring(self):
+        return len(self._retiring)
+
+    def idle_seconds(self):
+        """Seconds since the last lease was taken or returned, 0 while any page is leased"""
+        if self._leased:
+            return 0.0
+        return time.monotonic() - self.last_used
+
+    def stats(self):
+        """Snapshot of pool occupancy and browser state"""
+        return {
+            "size": self.size,
+            "leased": len(self._leased),
+            "available": self._idle.qsize(),
+            "browser_state": self.state,
+            "browser_connected": self._browser is not None,
+            "launches": self.launches,
+            "tasks_since_launch": self.tasks_since_launch,
+            "retiring_browsers": len(self._retiring),
+            "idle_seconds": round(self.idle_seconds(), 1),
+            "last_retire_reason": self.last_retire_reason,
+            "profile": self.profile.stats() if self.profile.enabled else None,
+        }
+
+    async def close(self):
+        """Close every context, the browser and Playwright"""
+        browsers = list(self._retiring) + ([self._browser] if self._browser else [])
+        self._retiring.clear()
+        self._browser = None
+        for browser in browsers:
+            try:
+                await browser.close()
+            except Exception as e:
+                logger.debug(f"Error closing browser: {e}")
+        self.state = 'stopped'
+        if self._playwright:
+            await self._playwright.stop()
+            self._playwright = None
@@ -0,0 +1,100 @@
+"""
+Persistent browser profile for the Orbit Agent Server
+Keeps Chromium's user-data directory (HTTP cache, cookies, service workers)
+across browser relaunches and daemon restarts, within a disk budget
+"""
+
+import logging
+import os
+import shutil
+
+logger = logging.getLogger(__name__)
+
+# Empty keeps the previous behaviour: a fresh, throwaway context per pool slot
+PROFILE_DIR = os.environ.get('AGENT_BROWSER_PROFILE_DIR', '')
+PROFILE_MAX_MB = float(os.environ.get('AGENT_BROWSER_PROFILE_MAX_MB', '1024'))
+# Chromium's own cap on the HTTP disk cache inside the profile
+CACHE_MAX_MB = float(os.environ.get('AGENT_BROWSER_CACHE_MAX_MB', '256'))
+
+# Caches Chromium rebuilds on its own, relative to the user-data directory,
+# cleared first (in this order) when the profile is over budget
+CACHE_DIRS = (
+    os.path.join('Default', 'Cache'),
+    os.path.join('Default', 'Code Cache'),
+    os.path.join('Default', 'Service Worker', 'CacheStorage'),
+    os.path.join('Default', 'Service Worker', 'ScriptCache'),
+    'GrShaderCache',
+    'ShaderCache',
+    os.path.join('Default', 'GPUCache'),
+)
+
+
+def directory_size(path):
+    """Total size in bytes of the files under path"""
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                continue
+    return total
+
+
+class BrowserProfile:
+    """
+    A user-data directory reused by every launch of the pool's browser.
+
+    Chromium holds a lock on the directory while it runs, so only one
+    browser process may use it at a time: the pool waits for a retired
+    browser to exit before relaunching, and worker processes each get their
+    own directory. `prepare` must run while no browser is using it; it
+    clears the caches Chromium can rebuild when the profile has grown past
+    `max_mb`, keeping cookies and site data.
+    """
+
+    def __init__(self, path=PROFILE_DIR, max_mb=PROFILE_MAX_MB, cache_max_mb=CACHE_MAX_MB):
+        self.path = os.path.abspath(os.path.expanduser(path)) if path else ''
+        self.max_bytes = max_mb * 1024 * 1024
+        self.cache_max_bytes = int(cache_max_mb * 1024 * 1024)
+        self.last_size = None
+        self.cleanups = 0
+
+    @property
+    def enabled(self):
+        return bool(self.path)
+
+    def launch_args(self):
+        """Extra Chromium arguments for a launch on this profile"""
+        return [f'--disk-cache-size={self.cache_max_bytes}'] if self.cache_max_bytes else []
+
+    def prepare(self):
+        """Create the directory and bring it under its size budget; call with no browser running"""
+        os.makedirs(self.path, exist_ok=True)
+        size = directory_size(self.path)
+        if self.max_bytes and size > self.max_bytes:
+            logger.info(f"Browser profile is {size / 1048576:.0f}MB, over {self.max_bytes / 1048576:.0f}MB; clearing caches")
+            for relative in CACHE_DIRS:
+                cache_dir = os.path.join(self.path, relative)
+                if not os.path.isdir(cache_dir):
+                    continue
+                size -= directory_size(cache_dir)
+                shutil.rmtree(cache_dir, ignore_errors=True)
+                if size <= self.max_bytes:
+                    break
+            self.cleanups += 1
+            if size > self.max_bytes:
+                logger.warning(
+                    f"Browser profile {self.path} is still {size / 1048576:.0f}MB after clearing caches; "
+                    f"delete it to start over"
+                )
+        self.last_size = size
+        return size
+
+    def stats(self):
+        return {
+            "path": self.path,
+            "size_mb": round(self.last_size / 1048576, 1) if self.last_size is not None else None,
+            "max_mb": round(self.max_bytes / 1048576),
+            "cleanups": self.cleanups,
+        }
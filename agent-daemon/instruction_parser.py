@@ -0,0 +1,294 @@
+"""
+Instruction parser for the Orbit Agent Server
+Turns natural-language browsing instructions into structured browser tasks
+"""
+
+import os
+import re
+from functools import lru_cache
+
+from site_registry import SITES
+
+# Website keywords by domain, in priority order (first matching site wins)
+WEBSITE_PATTERNS = SITES.keyword_table()
+DEFAULT_WEBSITE = SITES.default_domain
+
+# Task type keywords, in priority order (first matching type wins)
+TASK_TYPE_PATTERNS = {
+    'shopping': ['shop', 'buy', 'purchase', 'price', 'cost', 'under', 'cheap'],
+    'media': ['watch', 'video', 'tutorial', 'movie', 'show'],
+    'weather': ['weather', 'forecast', 'temperature'],
+    'information': ['news', 'article', 'read'],
+}
+
+CLICK_KEYWORDS = ['click']
+FIRST_RESULT_KEYWORDS = ['first link', 'first result', 'top result']
+FIRST_KEYWORDS = ['first']
+BROWSE_KEYWORDS = ['go to', 'visit', 'open', 'browse']
+
+# Search query patterns, tried in order
+SEARCH_PATTERNS = [re.compile(pattern) for pattern in [
+    # Direct search patterns
+    r'search (?:for |)(.+?)(?:\s+and\s+|\s*$)',
+    r'look (?:for |up |)(.+?)(?:\s+and\s+|\s*$)',
+    r'find (.+?)(?:\s+and\s+|\s*$)',
+    r'google (.+?)(?:\s+and\s+|\s*$)',
+
+    # Site-specific patterns
+    r'(?:go to|visit|open)\s+\w+(?:\.com|)\s+(?:and\s+)?(?:search for|look for|find)\s+(.+?)(?:\s+and\s+|\s*$)',
+    r'(?:on|from)\s+\w+(?:\.com|)\s+(?:search for|look for|find)\s+(.+?)(?:\s+and\s+|\s*$)',
+
+    # Shopping patterns
+    r'(?:look for|find|search for)\s+(.+?)\s+(?:under|below|less than|cheaper than)\s+[\$\d]+',
+    r'(?:look for|find|search for)\s+(.+?)\s+(?:on|at)\s+\w+',
+]]
+
+TRAILING_FILLER_PATTERN = re.compile(r'\s+(?:and|on|at|from|in|the)\s*$')
+
+PARSE_CACHE_SIZE = int(os.environ.get('AGENT_PARSE_CACHE_SIZE', '1024'))
+# Most sub-tasks one compound instruction is split into
+FAN_OUT_MAX = int(os.environ.get('AGENT_FAN_OUT_MAX', '4'))
+
+# A ';' followed by an action verb starts a follow-up step, not another query
+_NEXT_QUERY = r'\s*;(?!\s*(?:then\s+|and\s+)?(?:click|open|go|visit|browse|search|look|find|google|watch|read|buy)\b)'
+# Separators between several queries in one instruction; "compare" also splits on "and"/"with"
+QUERY_SEPARATOR_PATTERN = re.compile(rf'\s+(?:vs\.?|versus)\s+|{_NEXT_QUERY}')
+VERSUS_PATTERN = re.compile(r'\s(?:vs\.?|versus)\s')
+COMPARE_PATTERN = re.compile(r'\bcompare\s+(?:(?:the\s+)?prices?\s+(?:of|for)\s+)?(.+)$')
+COMPARE_SEPARATOR_PATTERN = re.compile(rf'\s+(?:vs\.?|versus|and|with|to)\s+|\s*,\s*|{_NEXT_QUERY}')
+
+
+def _trie_pattern(keywords):
+    """Build a regex alternation factored by common prefix so each position is tested cheaply"""
+    trie = {}
+    for keyword in keywords:
+        node = trie
+        for char in keyword:
+            node = node.setdefault(char, {})
+        node[''] = True
+
+    def build(node):
+        branches = [re.escape(char) + build(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ''
+        body = branches[0] if len(branches) == 1 else '(?:' + '|'.join(branches) + ')'
+        # Greedy optional suffix keeps the longest keyword at each position
+        return f'(?:{body})?' if '' in node else body
+
+    return build(trie)
+
+
+def _build_keyword_matcher(keywords):
+    """
+    Build a single regex that reports every keyword occurrence in one scan.
+
+    The zero-width lookahead lets matches overlap, and the trie pattern
+    reports the longest keyword at each position. Every shorter keyword
+    found at the same position is a prefix of that longest one, so the
+    prefix table recovers the full set of hits.
+    """
+    unique = set(keywords)
+    pattern = re.compile('(?=(' + _trie_pattern(unique) + '))')
+    prefixes = {
+        keyword: frozenset(k for k in unique if keyword.startswith(k))
+        for keyword in unique
+    }
+    return pattern, prefixes
+
+
+_ALL_KEYWORDS = (
+    [k for keywords in WEBSITE_PATTERNS.values() for k in keywords]
+    + [k for keywords in TASK_TYPE_PATTERNS.values() for k in keywords]
+    + CLICK_KEYWORDS + FIRST_RESULT_KEYWORDS + FIRST_KEYWORDS + BROWSE_KEYWORDS
+)
+_KEYWORD_PATTERN, _KEYWORD_PREFIXES = _build_keyword_matcher(_ALL_KEYWORDS)
+
+_WEBSITE_KEYWORDS = [(site, frozenset(keywords)) for site, keywords in WEBSITE_PATTERNS.items()]
+_TASK_TYPE_KEYWORDS = [(task_type, frozenset(keywords)) for task_type, keywords in TASK_TYPE_PATTERNS.items()]
+_CLICK_KEYWORDS = frozenset(CLICK_KEYWORDS)
+_FIRST_RESULT_KEYWORDS = frozenset(FIRST_RESULT_KEYWORDS)
+_FIRST_KEYWORDS = frozenset(FIRST_KEYWORDS)
+_BROWSE_KEYWORDS = frozenset(BROWSE_KEYWORDS)
+_SITE_KEYWORDS = frozenset(k for _, keywords in _WEBSITE_KEYWORDS for k in keywords)
+
+# A run of site names with the preposition that introduces it: "on amazon, ebay and walmart"
+_SITE_KEYWORD = '|'.join(re.escape(k) for k in sorted(
+    {k for keywords in WEBSITE_PATTERNS.values() for k in keywords}, key=len, reverse=True
+))
+_SITE_SEPARATOR = r'(?:\s*,\s*(?:and\s+|or\s+)?|\s+and\s+|\s+or\s+|\s*&\s*)'
+_SITE_LIST_PATTERN = re.compile(
+    rf'\b(?:on|at|from|across|between|using)\s+'
+    rf'(\b(?:{_SITE_KEYWORD})\b(?:{_SITE_SEPARATOR}\b(?:{_SITE_KEYWORD})\b)*)'
+)
+# The site a query is searched on, left at its start by "search google for cats vs dogs"
+_LEADING_SITE_PATTERN = re.compile(rf'^(?:{_SITE_KEYWORD})\s+(?:for\s+)?')
+
+
+def find_keywords(text):
+    """Return the set of known keywords that occur anywhere in text"""
+    hits = set()
+    for match in _KEYWORD_PATTERN.finditer(text):
+        hits |= _KEYWORD_PREFIXES[match.group(1)]
+    return hits
+
+
+def normalize_instruction(instruction):
+    """Lowercase and collapse whitespace so equivalent instructions share a cache entry"""
+    return ' '.join(instruction.lower().split())
+
+
+@lru_cache(maxsize=PARSE_CACHE_SIZE)
+def _parse_normalized(instruction_lower):
+    """Parse a normalized instruction into (website, search_query, actions, task_type)"""
+    hits = find_keywords(instruction_lower)
+
+    # Detect website from instruction
+    website = DEFAULT_WEBSITE
+    for site, keywords in _WEBSITE_KEYWORDS:
+        if hits & keywords:
+            website = site
+            break
+
+    # Extract search query
+    search_query = ""
+    for pattern in SEARCH_PATTERNS:
+        match = pattern.search(instruction_lower)
+        if match:
+            search_query = match.group(1).strip()
+            # Clean up common words
+            search_query = TRAILING_FILLER_PATTERN.sub('', search_query)
+            break
+
+    # Determine task type
+    task_type = 'general_browse'
+    for candidate, keywords in _TASK_TYPE_KEYWORDS:
+        if hits & keywords:
+            task_type = candidate
+            break
+
+    # Extract actions
+    actions = []
+    if hits & _CLICK_KEYWORDS:
+        if hits & (_FIRST_RESULT_KEYWORDS | _FIRST_KEYWORDS):
+            actions.append('click_first_result')
+        else:
+            actions.append('click_link')
+
+    # Add browse action if no specific search query but going to a site
+    if not search_query and hits & _BROWSE_KEYWORDS:
+        actions.append('navigate_and_browse')
+
+    return website, search_query, tuple(actions), task_type
+
+
+def parse_multi_step_instruction(instruction):
+    """
+    Parse web browsing instructions with comprehensive pattern recognition.
+
+    Examples of supported instructions:
+    - "go to google and search for headphones and click the first link"
+    - "go to amazon and look for laptops under 1200"
+    - "visit youtube and search for python tutorials"
+    - "open netflix and browse movies"
+    - "go to wikipedia and search for artificial intelligence"
+    - "search google for best restaurants near me"
+    - "find cheap flights on expedia"
+    - "look up the weather on weather.com"
+
+    Results are cached by normalized instruction; each call returns a fresh dict.
+    """
+    website, search_query, actions, task_type = _parse_normalized(normalize_instruction(instruction))
+
+    return {
+        'original_instruction': instruction,
+        'requires_browser': True,  # Default to true for web tasks
+        'search_query': search_query,
+        'actions': list(actions),
+        'website': website,
+        'task_type': task_type
+    }
+
+
+def mentioned_sites(hits):
+    """
+    Every site named by the keyword hits, in table order.
+
+    A site is left out when each of its hits is part of a longer hit, so
+    "google maps" names only maps.google.com and "netflix.com" does not
+    also name x.com.
+    """
+    sites = []
+    for site, keywords in _WEBSITE_KEYWORDS:
+        own = hits & keywords
+        if any(not any(k != other and k in other for other in hits) for k in own):
+            sites.append(site)
+    return sites
+
+
+def parse_fan_out(instruction, max_tasks=FAN_OUT_MAX):
+    """
+    Split a compound instruction into one parsed task per site and query, or return None.
+
+    Only two forms fan out: an explicit list of sites after a preposition
+    ("find headphones on amazon and ebay") and a comparison ("compare
+    airpods and galaxy buds on amazon", "search google for cats vs dogs").
+    Anything else, and any instruction whose queries would lose words or be
+    left empty once the site names are taken out, returns None so the
+    caller parses it as a single task. At most `max_tasks` are returned.
+    """
+    instruction_lower = normalize_instruction(instruction)
+    compare = COMPARE_PATTERN.search(instruction_lower)
+    site_lists = [match for match in _SITE_LIST_PATTERN.finditer(instruction_lower)
+                  if len(mentioned_sites(find_keywords(match.group(1)))) > 1]
+    if not (compare or site_lists or VERSUS_PATTERN.search(instruction_lower)):
+        return None
+
+    if site_lists:
+        sites = mentioned_sites(find_keywords(site_lists[0].group(1)))
+    else:
+        sites = [_parse_normalized(instruction_lower)[0]]
+
+    # Parse what is left once the site lists are gone, so the site names don't end up in the query
+    reduced = ' '.join(_SITE_LIST_PATTERN.sub(' ', instruction_lower).split())
+    _, search_query, actions, task_type = _parse_normalized(reduced)
+    compare = COMPARE_PATTERN.search(reduced)
+    if compare:
+        queries = COMPARE_SEPARATOR_PATTERN.split(TRAILING_FILLER_PATTERN.sub('', compare.group(1)))
+    else:
+        if not site_lists:
+            search_query = _LEADING_SITE_PATTERN.sub('', search_query)
+        queries = QUERY_SEPARATOR_PATTERN.split(search_query)
+    queries = list(dict.fromkeys(query.strip() for query in queries))
+
+    # A query that is empty, still names a site, or was glued together from words
+    # the site name used to separate means the instruction was not really compound
+    if any(not query or query not in instruction_lower or find_keywords(query) & _SITE_KEYWORDS
+           for query in queries):
+        return None
+    if len(sites) < 2 and len(queries) < 2:
+        return None
+
+    if compare and task_type == 'general_browse':
+        task_type = 'shopping'
+    return [
+        {
+            'original_instruction': instruction,
+            'requires_browser': True,
+            'search_query': query,
+            'actions': list(actions),
+            'website': site,
+            'task_type': task_type,
+        }
+        for site in sites
+        for query in queries
+    ][:max_tasks]
+
+
+def parse_cache_info():
+    """Expose parse cache statistics (hits, misses, maxsize, currsize)"""
+    return _parse_normalized.cache_info()
+
+
+def clear_parse_cache():
+    """Drop all cached parse results"""
+    _parse_normalized.cache_clear()
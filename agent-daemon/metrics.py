@@ -0,0 +1,166 @@
+"""
+In-process metrics for the Orbit Agent Server
+Minimal counters, histograms and gauges rendered in Prometheus text format
+"""
+
+import bisect
+import time
+from contextlib import contextmanager
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names, values, extra=None):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class Counter:
+    """Monotonic counter keyed by label values"""
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+
+    def inc(self, *labels, amount=1):
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, *labels):
+        return self._values.get(labels, 0)
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} counter']
+        for labels, value in sorted(self._values.items()):
+            lines.append(f'{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}')
+        return lines
+
+
+class Histogram:
+    """
+    Fixed-bucket histogram keyed by label values.
+
+    Recording is a bisect plus two list updates, cheap enough for the hot
+    path; cumulative bucket counts are only computed when rendering.
+    """
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # labels -> [per-bucket counts (+Inf last), sum]
+        self._series = {}
+
+    def observe(self, value, *labels):
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+        series[0][bisect.bisect_left(self.buckets, value)] += 1
+        series[1] += value
+
+    @contextmanager
+    def time(self, *labels):
+        """Observe the wall-clock duration of the enclosed block"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, *labels)
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} histogram']
+        bounds = self.buckets + (float('inf'),)
+        for labels, (counts, total) in sorted(self._series.items()):
+            cumulative = 0
+            for bound, count in zip(bounds, counts):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f'{self.name}_bucket{_format_labels(self.labelnames, labels, le)} {cumulative}')
+            label_text = _format_labels(self.labelnames, labels)
+            lines.append(f'{self.name}_sum{label_text} {_format_value(total)}')
+            lines.append(f'{self.name}_count{label_text} {cumulative}')
+        return lines
+
+
+class Gauge:
+    """Gauge whose value is read from a callback at scrape time"""
+
+    def __init__(self, name, documentation, callback):
+        self.name = name
+        self.documentation = documentation
+        self.callback = callback
+
+    def render(self):
+        return [
+            f'# HELP {self.name} {self.documentation}',
+            f'# TYPE {self.name} gauge',
+            f'{self.name} {_format_value(self.callback())}',
+        ]
+
+
+class MetricsRegistry:
+    """Collection of metrics exposed together on /metrics"""
+
+    def __init__(self):
+        self._metrics = {}
+
+    def register(self, metric):
+        self._metrics[metric.name] = metric
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+registry = MetricsRegistry()
+
+STAGE_LATENCY = registry.register(Histogram(
+    'agent_stage_duration_seconds',
+    'Latency of each automation stage (parse, acquire, goto, search_box, type_submit, extract, click_result)',
+    labelnames=('stage', 'site'),
+))
+
+TASK_OUTCOMES = registry.register(Counter(
+    'agent_task_outcomes_total',
+    'Browser task outcomes (success, captcha, selector_not_found, timeout, error, cancelled)',
+    labelnames=('site', 'outcome'),
+))
+
+BLOCKED_REQUESTS = registry.register(Counter(
+    'agent_blocked_requests_total',
+    'Requests aborted by resource blocking, by resource type',
+    labelnames=('site', 'resource_type'),
+))
+
+RESULT_CACHE_LOOKUPS = registry.register(Counter(
+    'agent_result_cache_lookups_total',
+    'Result cache lookups for search tasks (hit, miss, bypass)',
+    labelnames=('site', 'result'),
+))
+
+TASKS_COALESCED = registry.register(Counter(
+    'agent_tasks_coalesced_total',
+    'Browser task submissions that attached to an identical running or just-finished task',
+    labelnames=('site',),
+))
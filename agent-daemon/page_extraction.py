@@ -0,0 +1,118 @@
+"""
+Single-round-trip result extraction for the Orbit Agent Server
+Snapshots ranked search results in one injected page.evaluate call
+"""
+
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+RESULT_LIMIT = int(os.environ.get('AGENT_RESULT_LIMIT', '10'))
+
+# Attribute stamped on each extracted link so it can be clicked without re-querying
+RESULT_ATTRIBUTE = 'data-orbit-result'
+
+# Runs in the page: collects ranked links with title, snippet, visibility and
+# a hit test for clickability, and tags each link with its rank
+EXTRACT_SCRIPT = """
+({selectors, limit, attribute}) => {
+    const viewportWidth = window.innerWidth;
+    const viewportHeight = window.innerHeight;
+    const clean = (text) => (text || '').replace(/\\s+/g, ' ').trim();
+
+    for (const stale of document.querySelectorAll(`[${attribute}]`)) {
+        stale.removeAttribute(attribute);
+    }
+
+    const links = [];
+    const seen = new Set();
+    for (const selector of selectors) {
+        let nodes;
+        try {
+            nodes = document.querySelectorAll(selector);
+        } catch (e) {
+            continue;
+        }
+        for (const node of nodes) {
+            const link = node.closest('a[href]') || node.querySelector('a[href]');
+            if (!link || seen.has(link) || !/^https?:/.test(link.href)) continue;
+            seen.add(link);
+            links.push(link);
+        }
+    }
+
+    const results = [];
+    for (const link of links) {
+        if (results.length >= limit) break;
+        const heading = link.querySelector('h1, h2, h3, h4');
+        const title = clean(heading ? heading.innerText : link.innerText);
+        if (!title) continue;
+
+        // Snippet: text of the nearest ancestor that holds more than the title
+        let snippet = '';
+        let block = link.parentElement;
+        for (let depth = 0; block && depth < 6; depth++, block = block.parentElement) {
+            const text = clean(block.innerText);
+            if (text.length > title.length + 40) {
+                snippet = clean(text.replace(title, '')).slice(0, 300);
+                break;
+            }
+        }
+
+        const rect = link.getBoundingClientRect();
+        const style = window.getComputedStyle(link);
+        const visible = rect.width > 0 && rect.height > 0
+            && style.visibility !== 'hidden' && style.display !== 'none' && style.opacity !== '0';
+        const inViewport = rect.bottom > 0 && rect.right > 0 && rect.top < viewportHeight && rect.left < viewportWidth;
+        let clickable = visible && link.getAttribute('aria-disabled') !== 'true';
+        if (clickable && inViewport) {
+            // Off-screen links are scrolled to before clicking; on-screen ones must not be covered
+            const x = Math.min(Math.max(rect.left + rect.width / 2, 0), viewportWidth - 1);
+            const y = Math.min(Math.max(rect.top + rect.height / 2, 0), viewportHeight - 1);
+            const hit = document.elementFromPoint(x, y);
+            clickable = !!hit && (link.contains(hit) || hit.contains(link));
+        }
+
+        const rank = results.length;
+        link.setAttribute(attribute, String(rank));
+        results.push({rank, title, url: link.href, snippet, visible, in_viewport: inViewport, clickable});
+    }
+
+    return {url: location.href, title: document.title, results};
+}
+"""
+
+
+def result_selector(rank):
+    """CSS selector for the link extracted at rank in the latest snapshot"""
+    return f'[{RESULT_ATTRIBUTE}="{rank}"]'
+
+
+async def extract_results(page, selectors, limit=RESULT_LIMIT, wait_timeout=3000):
+    """
+    Snapshot the ranked results on the current page.
+
+    Waits briefly for the first selector match so client-rendered result
+    lists have a chance to appear, then gathers everything in one evaluate
+    call. Returns {"url", "title", "results": [...]}; results is empty when
+    nothing matched.
+    """
+    if wait_timeout and selectors:
+        try:
+            await page.wait_for_selector(', '.join(selectors), state='attached', timeout=wait_timeout)
+        except Exception as e:
+            logger.info(f"No results matched on {page.url} within {wait_timeout}ms: {e}")
+
+    snapshot = await page.evaluate(
+        EXTRACT_SCRIPT, {'selectors': list(selectors), 'limit': limit, 'attribute': RESULT_ATTRIBUTE}
+    )
+    logger.info(f"Extracted {len(snapshot['results'])} results from {snapshot['url']}")
+    return snapshot
+
+
+def first_clickable(snapshot):
+    """Highest-ranked result that can be clicked, or None"""
+    if not snapshot:
+        return None
+    return next((result for result in snapshot['results'] if result['clickable']), None)
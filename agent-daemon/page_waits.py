@@ -0,0 +1,101 @@
+"""
+Latency profiles and condition-based waits for browser automation
+Replaces fixed sleeps with load-state, selector and URL-change predicates
+"""
+
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PROFILE = os.environ.get('AGENT_LATENCY_PROFILE', 'fast')
+NAVIGATION_TIMEOUT = int(os.environ.get('AGENT_NAVIGATION_TIMEOUT_MS', '15000'))
+
+
+class LatencyProfile:
+    """
+    Input pacing for one task.
+
+    `pauses` maps a named step to extra milliseconds slept after that step's
+    event wait has already resolved; `key_delay` is the per-character typing
+    delay, with 0 meaning the input is filled in one shot. With
+    `direct_search`, sites that have a search-URL template are opened
+    straight on their results page instead of typing into the search box.
+    """
+
+    def __init__(self, name, key_delay, pauses, direct_search):
+        self.name = name
+        self.key_delay = key_delay
+        self.pauses = pauses
+        self.direct_search = direct_search
+
+    async def pause(self, page, step):
+        """Sleep for the step's configured pause, if any"""
+        delay = self.pauses.get(step, 0)
+        if delay:
+            await page.wait_for_timeout(delay)
+
+
+LATENCY_PROFILES = {
+    # Instant fills, event waits only, direct results URLs where known
+    'fast': LatencyProfile('fast', key_delay=0, pauses={}, direct_search=True),
+    # The original pacing, kept for sites that react badly to instant input
+    'humanlike': LatencyProfile('humanlike', key_delay=100, pauses={
+        'after_goto': 2000,
+        'after_focus': 500,
+        'after_clear': 200,
+        'after_type': 300,
+        'after_submit': 3000,
+        'before_click_result': 2000,
+        'after_scroll': 500,
+        'after_click': 2000,
+    }, direct_search=False),
+}
+
+
+def get_latency_profile(name=None):
+    """Look up a latency profile by name, falling back to the configured default"""
+    name = name or DEFAULT_PROFILE
+    try:
+        return LATENCY_PROFILES[name]
+    except KeyError:
+        raise ValueError(f"Unknown latency profile '{name}', expected one of {sorted(LATENCY_PROFILES)}") from None
+
+
+async def enter_text(page, element, text, profile):
+    """Replace an input's value with text using the profile's pacing"""
+    if not profile.key_delay:
+        await element.fill(text)
+        return
+
+    await element.click()
+    await profile.pause(page, 'after_focus')
+    await element.fill("")
+    await profile.pause(page, 'after_clear')
+    await element.type(text, delay=profile.key_delay)
+    await profile.pause(page, 'after_type')
+
+
+async def wait_for_url_change(page, previous_url, timeout=NAVIGATION_TIMEOUT):
+    """
+    Wait until the page leaves previous_url and its DOM is ready.
+
+    Returns False instead of raising if nothing navigated in time, so callers
+    can carry on with whatever the page shows.
+    """
+    try:
+        await page.wait_for_url(lambda url: url != previous_url, timeout=timeout)
+        await page.wait_for_load_state('domcontentloaded', timeout=timeout)
+        return True
+    except Exception as e:
+        logger.info(f"No navigation away from {previous_url} within {timeout}ms: {e}")
+        return False
+
+
+async def submit_and_wait(page, element, profile, timeout=NAVIGATION_TIMEOUT):
+    """Press Enter in element and wait for the resulting navigation"""
+    previous_url = page.url
+    await element.press("Enter")
+    navigated = await wait_for_url_change(page, previous_url, timeout=timeout)
+    await profile.pause(page, 'after_submit')
+    return navigated
@@ -0,0 +1,184 @@
+"""
+Request-level resource blocking for automation page loads
+Aborts heavy resource types and known trackers on a task's browser context
+or page
+"""
+
+import logging
+import os
+import re
+from contextlib import asynccontextmanager
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BLOCK_MODE = os.environ.get('AGENT_BLOCK_RESOURCES', 'trackers')
+
+# Resource types aborted in each mode; every mode except 'none' also blocks trackers
+BLOCK_MODES = {
+    'none': frozenset(),
+    'trackers': frozenset(),
+    'lean': frozenset({'media', 'font'}),
+    'minimal': frozenset({'image', 'media', 'font'}),
+}
+
+# Third-party ad/analytics hosts never needed to drive a page
+TRACKER_DOMAINS = (
+    'doubleclick.net',
+    'googlesyndication.com',
+    'googleadservices.com',
+    'google-analytics.com',
+    'googletagmanager.com',
+    'googletagservices.com',
+    'adservice.google.com',
+    'amazon-adsystem.com',
+    'connect.facebook.net',
+    'scorecardresearch.com',
+    'quantserve.com',
+    'criteo.com',
+    'criteo.net',
+    'taboola.com',
+    'outbrain.com',
+    'adnxs.com',
+    'hotjar.com',
+    'newrelic.com',
+    'nr-data.net',
+    'segment.io',
+    'optimizely.com',
+)
+
+TRACKER_PATTERN = re.compile(
+    r'^https?://([^/:]+\.)?(' + '|'.join(re.escape(domain) for domain in TRACKER_DOMAINS) + r')(:\d+)?/'
+)
+
+# The same hosts as Chromium URL patterns for Network.setBlockedURLs
+TRACKER_URL_PATTERNS = [
+    pattern for domain in TRACKER_DOMAINS for pattern in (f'*://{domain}/*', f'*://*.{domain}/*')
+]
+# Failure text of a request Chromium blocked itself
+BLOCKED_BY_CLIENT = 'net::ERR_BLOCKED_BY_CLIENT'
+
+# Rough transfer sizes per aborted request, used to estimate bandwidth saved
+TYPICAL_BYTES = {
+    'image': 30_000,
+    'media': 500_000,
+    'font': 30_000,
+    'script': 25_000,
+    'stylesheet': 15_000,
+}
+DEFAULT_TYPICAL_BYTES = 5_000
+
+
+def resolve_block_mode(requested=None, site_default=None):
+    """Pick the task's mode: request override, then the site's default, then the global default"""
+    mode = requested or site_default or DEFAULT_BLOCK_MODE
+    if mode not in BLOCK_MODES:
+        raise ValueError(f"Unknown resource blocking mode '{mode}', expected one of {sorted(BLOCK_MODES)}")
+    return mode
+
+
+class ResourceBlocker:
+    """
+    Applies a block policy to one browser context's (or page's) requests.
+
+    Playwright disables the HTTP cache wherever a route is installed, so
+    tracker-only mode, the default, hands its host list to Chromium over
+    CDP (Network.setBlockedURLs) instead. Pages then keep using the disk
+    cache of a persistent profile and the cache between a task's own
+    navigations. The type-based modes have to see every request through a
+    route, and give up the cache while they are attached. Without a CDP
+    session (non-Chromium browsers) trackers are routed too.
+    """
+
+    def __init__(self, mode):
+        self.mode = mode
+        self.block_types = BLOCK_MODES[mode]
+        self.blocked_by_type = {}
+
+    @property
+    def enabled(self):
+        return self.mode != 'none'
+
+    @property
+    def route_pattern(self):
+        return '**/*' if self.block_types else TRACKER_PATTERN
+
+    def _record(self, resource_type):
+        self.blocked_by_type[resource_type] = self.blocked_by_type.get(resource_type, 0) + 1
+
+    async def _handle(self, route):
+        request = route.request
+        resource_type = request.resource_type
+        try:
+            if resource_type in self.block_types or TRACKER_PATTERN.match(request.url):
+                self._record(resource_type)
+                await route.abort('blockedbyclient')
+            else:
+                await route.continue_()
+        except Exception as e:
+            # The route may already be handled if the page navigated or closed
+            logger.debug(f"Route handling failed for {request.url}: {e}")
+
+    def _on_request_failed(self, request):
+        if request.failure == BLOCKED_BY_CLIENT:
+            self._record(request.resource_type)
+
+    async def _block_with_cdp(self, page):
+        """CDP session blocking the tracker hosts on page, or None if CDP is unavailable"""
+        try:
+            cdp = await page.context.new_cdp_session(page)
+            await cdp.send('Network.enable')
+            await cdp.send('Network.setBlockedURLs', {'urls': TRACKER_URL_PATTERNS})
+            return cdp
+        except Exception as e:
+            logger.debug(f"CDP URL blocking unavailable, routing trackers instead: {e}")
+            return None
+
+    @asynccontextmanager
+    async def attached(self, context, page=None):
+        """
+        Apply the policy to context (or a single page) for the duration of the block.
+
+        `page` is the task's page; tracker-only blocking goes through its
+        CDP session when given, leaving the HTTP cache enabled.
+        """
+        if not self.enabled:
+            yield self
+            return
+
+        cdp = await self._block_with_cdp(page) if page is not None and not self.block_types else None
+        if cdp is not None:
+            context.on('requestfailed', self._on_request_failed)
+            try:
+                yield self
+            finally:
+                context.remove_listener('requestfailed', self._on_request_failed)
+                try:
+                    await cdp.send('Network.setBlockedURLs', {'urls': []})
+                    await cdp.detach()
+                except Exception as e:
+                    logger.debug(f"Could not clear blocked URLs: {e}")
+            return
+
+        pattern = self.route_pattern
+        await context.route(pattern, self._handle)
+        try:
+            yield self
+        finally:
+            try:
+                await context.unroute(pattern, self._handle)
+            except Exception as e:
+                logger.debug(f"Could not remove resource route: {e}")
+
+    def summary(self):
+        """Requests blocked and the estimated bytes that were not downloaded"""
+        requests_blocked = sum(self.blocked_by_type.values())
+        estimated_bytes = sum(
+            TYPICAL_BYTES.get(resource_type, DEFAULT_TYPICAL_BYTES) * count
+            for resource_type, count in self.blocked_by_type.items()
+        )
+        return {
+            "mode": self.mode,
+            "requests_blocked": requests_blocked,
+            "blocked_by_type": dict(self.blocked_by_type),
+            "estimated_bytes_saved": estimated_bytes,
+        }
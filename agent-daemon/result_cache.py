@@ -0,0 +1,145 @@
+"""
+Result cache for the Orbit Agent Server
+Remembers finished site/query tasks so repeats can skip the search
+"""
+
+import json
+import logging
+import os
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+RESULT_CACHE_SIZE = int(os.environ.get('AGENT_RESULT_CACHE_SIZE', '256'))
+# Empty keeps the cache in memory only; search history stays off disk unless asked for
+RESULT_CACHE_PATH = os.environ.get('AGENT_RESULT_CACHE_PATH', '')
+# Minimum seconds between disk writes; pending entries are flushed on shutdown
+RESULT_CACHE_SAVE_INTERVAL = float(os.environ.get('AGENT_RESULT_CACHE_SAVE_INTERVAL', '30'))
+
+# Seconds a result stays fresh, by task type; sites can override with `cache_ttl`
+TASK_TYPE_TTLS = {
+    'weather': 600,
+    'information': 1800,
+    'shopping': 1800,
+    'media': 3600,
+    'general_browse': 3600,
+}
+DEFAULT_TTL = 1800
+
+
+def cache_key(website, search_query, actions):
+    """Key shared by tasks that would do the same thing on the same site"""
+    query = ' '.join(search_query.lower().split())
+    return f"{website}|{query}|{','.join(sorted(set(actions)))}"
+
+
+def ttl_for(task_type, site_ttl=None):
+    """Freshness window for a task: the site's own TTL, else its task type's"""
+    if site_ttl is not None:
+        return site_ttl
+    return TASK_TYPE_TTLS.get(task_type, DEFAULT_TTL)
+
+
+class ResultCache:
+    """
+    Bounded LRU of finished task results with per-entry expiry.
+
+    Entries are {"result", "stored_at", "expires_at", "hits"}. Expired
+    entries are dropped when looked up or when the cache is saved.
+    """
+
+    def __init__(self, max_entries=RESULT_CACHE_SIZE, path=RESULT_CACHE_PATH, save_interval=RESULT_CACHE_SAVE_INTERVAL):
+        self.max_entries = max_entries
+        self.path = path
+        self.save_interval = save_interval
+        self._entries = OrderedDict()
+        self._dirty = False
+        self._last_save = 0.0
+        self.hits = 0
+        self.misses = 0
+        self._load()
+
+    @property
+    def enabled(self):
+        return self.max_entries > 0
+
+    def _load(self):
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path) as f:
+                entries = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable result cache {self.path}: {e}")
+            return
+
+        now = time.time()
+        for key, entry in entries.items():
+            if entry['expires_at'] > now:
+                self._entries[key] = entry
+        self._evict()
+        logger.info(f"Loaded {len(self._entries)} cached results from {self.path}")
+
+    def _evict(self):
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def get(self, key):
+        """Fresh entry for key, or None"""
+        entry = self._entries.get(key)
+        if entry is not None and entry['expires_at'] <= time.time():
+            del self._entries[key]
+            self._dirty = True
+            entry = None
+
+        if entry is None:
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(key)
+        entry['hits'] += 1
+        self.hits += 1
+        return entry
+
+    def put(self, key, result, ttl):
+        """Store a finished task's result for ttl seconds"""
+        if not self.enabled or ttl <= 0:
+            return
+        now = time.time()
+        self._entries[key] = {'result': result, 'stored_at': now, 'expires_at': now + ttl, 'hits': 0}
+        self._entries.move_to_end(key)
+        self._evict()
+        self._dirty = True
+        if now - self._last_save >= self.save_interval:
+            self.flush()
+
+    def invalidate(self, key):
+        if self._entries.pop(key, None) is not None:
+            self._dirty = True
+
+    def flush(self):
+        """Write unsaved entries to disk, if persistence is configured"""
+        if not self.path or not self._dirty:
+            return
+        now = time.time()
+        entries = {key: entry for key, entry in self._entries.items() if entry['expires_at'] > now}
+        try:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump(entries, f)
+            os.replace(tmp_path, self.path)
+            self._dirty = False
+        except OSError as e:
+            logger.warning(f"Could not persist result cache to {self.path}: {e}")
+        self._last_save = now
+
+    def stats(self):
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "persistent": bool(self.path),
+        }
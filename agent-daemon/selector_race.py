@@ -0,0 +1,107 @@
+"""
+Concurrent selector resolution for the Orbit Agent Server
+Races candidate selectors and remembers which one won on each site
+"""
+
+import asyncio
+import json
+import logging
+import os
+import time
+
+logger = logging.getLogger(__name__)
+
+SELECTOR_CACHE_PATH = os.environ.get(
+    'AGENT_SELECTOR_CACHE_PATH',
+    os.path.join(os.path.expanduser('~'), '.orbit-agent', 'selector_cache.json')
+)
+HEAD_START_MS = int(os.environ.get('AGENT_SELECTOR_HEAD_START_MS', '300'))
+
+
+async def race_selectors(page, selectors, timeout=3000, state='visible', preferred=None, head_start=HEAD_START_MS):
+    """
+    Wait for candidate selectors concurrently and return the first match.
+
+    Returns (selector, element), or (None, None) when nothing matched within
+    `timeout` ms. A `preferred` selector starts immediately and the others
+    start `head_start` ms later, so a known-good selector usually wins without
+    the rest ever touching the page. Losing waits are cancelled.
+    """
+    if not selectors:
+        return None, None
+
+    has_preferred = preferred in selectors
+    ordered = ([preferred] if has_preferred else []) + [s for s in selectors if s != preferred]
+
+    async def probe(index, selector):
+        if has_preferred and index > 0 and head_start:
+            await asyncio.sleep(head_start / 1000)
+        element = await page.wait_for_selector(selector, state=state, timeout=timeout)
+        return index, selector, element
+
+    pending = {asyncio.create_task(probe(index, selector)) for index, selector in enumerate(ordered)}
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            matches = sorted(task.result() for task in done if not task.cancelled() and task.exception() is None)
+            for _, selector, element in matches:
+                if element:
+                    return selector, element
+        return None, None
+    finally:
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+
+
+class SelectorMemory:
+    """
+    Per-site record of the selector that most recently won a race.
+
+    Stored as {site: {purpose: {"selector", "hits", "updated_at"}}} and
+    written to disk only when a site's winner changes.
+    """
+
+    def __init__(self, path=SELECTOR_CACHE_PATH):
+        self.path = path
+        self._entries = self._load()
+
+    def _load(self):
+        if not self.path or not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable selector cache {self.path}: {e}")
+            return {}
+
+    def _save(self):
+        if not self.path:
+            return
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump(self._entries, f, indent=2, sort_keys=True)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            logger.warning(f"Could not persist selector cache to {self.path}: {e}")
+
+    def preferred(self, site, purpose):
+        """Selector that last won for this site and purpose, if any"""
+        entry = self._entries.get(site, {}).get(purpose)
+        return entry['selector'] if entry else None
+
+    def record(self, site, purpose, selector):
+        """Remember the winning selector for this site and purpose"""
+        site_entries = self._entries.setdefault(site, {})
+        entry = site_entries.get(purpose)
+        if entry and entry['selector'] == selector:
+            entry['hits'] += 1
+            entry['updated_at'] = time.time()
+            return
+
+        site_entries[purpose] = {'selector': selector, 'hits': 1, 'updated_at': time.time()}
+        logger.info(f"Learned {purpose} selector for {site}: {selector}")
+        self._save()
@@ -4,24 +4,90 @@ Simple Agent Server for Orbit Desktop Assistant
 Provides browser automation and AI agent capabilities
 """
 
+import argparse
 import asyncio
+import functools
+import json
 import logging
-from fastapi import FastAPI, WebSocket
+import os
+import time
+import uuid
+from contextlib import asynccontextmanager, nullcontext
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect
+from fastapi.responses import FileResponse, JSONResponse, PlainTextResponse, StreamingResponse
+from playwright.async_api import TimeoutError as PlaywrightTimeoutError
 import uvicorn
-from playwright.async_api import async_playwright
-import re
+from browser_lifecycle import BrowserLifecycle
+from browser_pool import BrowserPool, PoolTimeoutError
+from instruction_parser import parse_fan_out, parse_multi_step_instruction
+from metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE
+from metrics import BLOCKED_REQUESTS, RESULT_CACHE_LOOKUPS, TASK_OUTCOMES, TASKS_COALESCED, Gauge, registry as metrics_registry
+from resource_blocking import ResourceBlocker, resolve_block_mode
+from page_extraction import extract_results, first_clickable, result_selector
+from result_cache import ResultCache, cache_key, ttl_for
+from page_waits import NAVIGATION_TIMEOUT, enter_text, get_latency_profile, submit_and_wait, wait_for_url_change
+from selector_race import SelectorMemory, race_selectors
+from site_registry import SITES
+from task_registry import BACKGROUND, INTERACTIVE, SUCCEEDED, TERMINAL_EVENTS, QueueFullError, TaskRegistry, current_task, report_progress
+from task_trace import TaskTrace, TraceStore, capture_screenshot, observe_stage, timed_stage
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Shared browser pool: one Chromium process, one isolated context per task
+browser_pool = BrowserPool()
+
+# Prewarms, recycles and idles out the pool's browser in the background
+browser_lifecycle = BrowserLifecycle(browser_pool)
+
+# Per-site record of which candidate selector won recently, persisted across restarts
+selector_memory = SelectorMemory()
+
+# Tracks browser tasks and bounds how many run or wait at once
+task_registry = TaskRegistry()
+
+# Finished search tasks, replayed by opening their final URL until they expire
+result_cache = ResultCache()
+
+# Ring buffer of per-task traces and failure screenshots on disk
+trace_store = TraceStore()
+
+# Longest /agent/run will hold the response open when the client asks to wait
+RUN_WAIT_TIMEOUT = float(os.environ.get('AGENT_RUN_WAIT_TIMEOUT', '30'))
+
+# Most instructions one /agent/run_batch request may carry
+BATCH_MAX_ITEMS = int(os.environ.get('AGENT_BATCH_MAX_ITEMS', '1000'))
+# Items of one batch in the task queue at once; 0 matches the task concurrency
+BATCH_CONCURRENCY = int(os.environ.get('AGENT_BATCH_CONCURRENCY', '0'))
+
+@asynccontextmanager
+async def lifespan(app):
+    """Start the browser in the background at startup; tear everything down on shutdown"""
+    browser_lifecycle.start()
+    yield
+    await task_registry.close()
+    await trace_store.close()
+    await browser_lifecycle.stop()
+    result_cache.flush()
+
 # Create FastAPI app
-app = FastAPI(title="Orbit Agent Server", version="1.0.0")
+app = FastAPI(title="Orbit Agent Server", version="1.0.0", lifespan=lifespan)
 
-# Global browser instance for reuse
-global_browser = None
-global_page = None
-global_playwright = None
+# Gauges are read at scrape time so they add nothing to the task hot path
+metrics_registry.register(Gauge(
+    'agent_tasks_in_flight', 'Browser tasks currently running', lambda: task_registry.stats()['running']
+))
+metrics_registry.register(Gauge(
+    'agent_tasks_queued', 'Browser tasks waiting for a worker', lambda: task_registry.stats()['queued']
+))
+metrics_registry.register(Gauge(
+    'agent_browser_processes', 'Live browser processes, including retired ones still draining',
+    lambda: int(browser_pool.has_browser) + browser_pool.retiring
+))
+metrics_registry.register(Gauge(
+    'agent_browser_pages_leased', 'Pooled pages currently leased to tasks', lambda: browser_pool.leased
+))
 
 @app.get("/")
 async def root():
@@ -30,67 +96,151 @@ async def root():
 
 @app.get("/health")
 async def health():
-    """Health check endpoint"""
-    return {"status": "healthy", "service": "orbit-agent-server"}
+    """Health check endpoint; always 200 since LLM routing works without a browser, `status` says whether browser tasks can run"""
+    return {
+        "status": browser_lifecycle.health(),
+        "service": "orbit-agent-server",
+        "browser": browser_lifecycle.stats(),
+        "tasks": task_registry.stats(),
+        "result_cache": result_cache.stats()
+    }
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus text-format metrics"""
+    return PlainTextResponse(metrics_registry.render(), media_type=METRICS_CONTENT_TYPE)
 
 @app.websocket("/ws")
 async def websocket_endpoint(websocket: WebSocket):
-    """WebSocket endpoint for real-time communication with Orbit app"""
+    """
+    WebSocket endpoint for real-time communication with Orbit app.
+    
+    One connection carries many tasks. Client messages are JSON objects:
+    - {"type": "submit", "request_id": ..., "task": ..., "use_browser": ..., "latency_profile": ..., "session": ...}
+    - {"type": "cancel", "task_id": ...}
+    - {"type": "status", "task_id": ...}
+    - {"type": "ping"}
+    
+    Replies echo the client's request_id. After "accepted", progress events
+    ({"type": "progress", "task_id", "event", "elapsed_ms", ...}) stream until
+    a done, error or cancelled event. Non-JSON text gets the legacy echo.
+    """
     await websocket.accept()
     logger.info("WebSocket connection established")
     
+    outgoing = asyncio.Queue()
+    subscriptions = {}
+    sender = asyncio.create_task(_websocket_sender(websocket, outgoing))
+    
     try:
         while True:
             # Receive message from Orbit app
             data = await websocket.receive_text()
             logger.info(f"Received: {data}")
             
-            # Echo response (replace with actual agent logic)
-            response = f"Agent processed: {data}"
-            await websocket.send_text(response)
+            try:
+                message = json.loads(data)
+            except ValueError:
+                message = None
             
+            if not isinstance(message, dict):
+                # Legacy plain-text echo
+                outgoing.put_nowait(f"Agent processed: {data}")
+                continue
+            
+            await handle_websocket_message(message, outgoing, subscriptions)
+            
+    except WebSocketDisconnect:
+        pass
     except Exception as e:
         logger.error(f"WebSocket error: {e}")
     finally:
+        # Tasks keep running; this connection just stops listening to them
+        for record, callback in subscriptions.values():
+            record.unsubscribe(callback)
+        sender.cancel()
         logger.info("WebSocket connection closed")
 
+async def _websocket_sender(websocket, outgoing):
+    """Serialize all writes to one WebSocket from a single coroutine"""
+    while True:
+        message = await outgoing.get()
+        if isinstance(message, str):
+            await websocket.send_text(message)
+        else:
+            await websocket.send_json(message)
+
+async def handle_websocket_message(message, outgoing, subscriptions):
+    """Dispatch one JSON protocol message from a WebSocket client"""
+    message_type = message.get("type")
+    request_id = message.get("request_id")
+    
+    if message_type == "ping":
+        outgoing.put_nowait({"type": "pong", "request_id": request_id})
+    
+    elif message_type == "submit":
+        try:
+            response = await start_agent_task(message)
+        except QueueFullError as e:
+            outgoing.put_nowait({
+                "type": "rejected", "request_id": request_id,
+                "error": "Agent is busy, task queue is full", "retry_after": e.retry_after
+            })
+            return
+        except Exception as e:
+            logger.error(f"Agent execution error: {e}")
+            outgoing.put_nowait({"type": "error", "request_id": request_id, "error": str(e)})
+            return
+        
+        task_id = response.get("task_id")
+        outgoing.put_nowait({"type": "accepted", "request_id": request_id, "task_id": task_id, "response": response})
+        
+        record = task_registry.get(task_id) if task_id else None
+        if record is not None:
+            def forward(event, task_id=task_id, request_id=request_id):
+                outgoing.put_nowait({"type": "progress", "request_id": request_id, **event})
+                if event["event"] in TERMINAL_EVENTS and task_id in subscriptions:
+                    record, callback = subscriptions.pop(task_id)
+                    record.unsubscribe(callback)
+            
+            subscriptions[task_id] = (record, forward)
+            record.subscribe(forward)
+    
+    elif message_type in ("cancel", "status"):
+        task_id = message.get("task_id")
+        record = task_registry.cancel(task_id) if message_type == "cancel" else task_registry.get(task_id)
+        if record is None:
+            outgoing.put_nowait({"type": "error", "request_id": request_id, "error": f"Unknown task: {task_id}"})
+        else:
+            outgoing.put_nowait({"type": message_type, "request_id": request_id, **record.to_dict()})
+    
+    else:
+        outgoing.put_nowait({"type": "error", "request_id": request_id, "error": f"Unknown message type: {message_type}"})
+
 @app.post("/agent/run")
 async def run_agent_task(request: dict):
     """Execute browser automation or return LLM-suitable response"""
+    # Checked before anything is queued, so a bad value never leaves an orphaned task behind
     try:
-        # Get the task description from the request
-        task_description = request.get("task", "")
-        use_browser = request.get("use_browser", False)
-        
-        logger.info(f"Executing agent task: {task_description}")
-        logger.info(f"Use browser: {use_browser}")
-        
-        if not task_description:
-            return {
-                "status": "error", 
-                "error": "No task description provided"
-            }
-        
-        if use_browser:
-            # Parse the task and execute browser automation
-            parsed_task = parse_multi_step_instruction(task_description)
-            logger.info(f"Parsed task: {parsed_task}")
-            result = await execute_browser_task(parsed_task)
-        else:
-            # Return response indicating this should be handled by LLM
-            logger.info(f"Task identified as LLM-suitable: {task_description}")
-            result = {
-                "status": "llm_response",
-                "result": {
-                    "message": "This question can be answered directly by the AI assistant",
-                    "task": task_description,
-                    "use_llm": True,
-                    "summary": f"Please use the LLM to answer: {task_description}"
-                }
-            }
+        timeout = wait_timeout(request.get("wait"))
+    except ValueError as e:
+        return JSONResponse(status_code=400, content={"status": "error", "error": str(e)})
+    
+    try:
+        response = await start_agent_task(request)
         
-        return result
+        # With "wait", hold the response until the task finishes so it carries real results
+        if timeout and response.get("task_id"):
+            await add_task_outcome(response, timeout)
+        return response
         
+    except QueueFullError as e:
+        logger.warning(f"Rejecting agent task: {e}")
+        return JSONResponse(
+            status_code=429,
+            headers={"Retry-After": str(e.retry_after)},
+            content={"status": "error", "error": "Agent is busy, task queue is full", "retry_after": e.retry_after}
+        )
     except Exception as e:
         logger.error(f"Agent execution error: {e}")
         return {
@@ -98,112 +248,225 @@ async def run_agent_task(request: dict):
             "error": str(e)
         }
 
-def parse_multi_step_instruction(instruction):
-    """
-    Parse web browsing instructions with comprehensive pattern recognition.
-    
-    Examples of supported instructions:
-    - "go to google and search for headphones and click the first link"
-    - "go to amazon and look for laptops under 1200"
-    - "visit youtube and search for python tutorials"
-    - "open netflix and browse movies"
-    - "go to wikipedia and search for artificial intelligence"
-    - "search google for best restaurants near me"
-    - "find cheap flights on expedia"
-    - "look up the weather on weather.com"
-    """
-    instruction_lower = instruction.lower()
-    
-    # Initialize result structure
-    parsed = {
-        'original_instruction': instruction,
-        'requires_browser': True,  # Default to true for web tasks
-        'search_query': '',
-        'actions': [],
-        'website': '',
-        'task_type': 'general_browse'
-    }
+def wait_timeout(wait):
+    """Seconds a /agent/run request holds its response for `wait`, 0 for none; ValueError if invalid"""
+    if wait is None or wait is False:
+        return 0
+    if wait is True:
+        return RUN_WAIT_TIMEOUT
+    if not isinstance(wait, (int, float)) or wait < 0:
+        raise ValueError(f"wait must be true, false or a number of seconds, got {wait!r}")
+    return min(float(wait), RUN_WAIT_TIMEOUT)
+
+@app.post("/agent/run_batch")
+async def run_agent_batch(request: dict):
+    """Run many browser tasks with bounded concurrency, streaming each result as NDJSON as it finishes"""
+    items = request.get("items")
+    if not isinstance(items, list) or not items:
+        return JSONResponse(status_code=400, content={"status": "error", "error": "No batch items provided"})
+    if len(items) > BATCH_MAX_ITEMS:
+        return JSONResponse(
+            status_code=400,
+            content={"status": "error", "error": f"Batch has {len(items)} items, the limit is {BATCH_MAX_ITEMS}"}
+        )
+    limit = request.get("concurrency")
+    if limit is not None and (isinstance(limit, bool) or not isinstance(limit, int) or limit < 1):
+        return JSONResponse(
+            status_code=400,
+            content={"status": "error", "error": f"Batch concurrency must be a positive integer, got {limit!r}"}
+        )
     
-    # Detect website from instruction
-    website_patterns = {
-        'google': ['google', 'search google', 'google search'],
-        'maps.google.com': ['google maps', 'maps', 'google map'],
-        'amazon': ['amazon', 'amazon.com'],
-        'youtube': ['youtube', 'youtube.com'],
-        'netflix': ['netflix', 'netflix.com'],
-        'wikipedia': ['wikipedia', 'wiki'],
-        'expedia': ['expedia', 'expedia.com'],
-        'weather.com': ['weather.com', 'weather website'],
-        'ebay': ['ebay', 'ebay.com'],
-        'facebook': ['facebook', 'fb.com'],
-        'twitter': ['twitter', 'twitter.com', 'x.com'],
-        'reddit': ['reddit', 'reddit.com'],
-        'github': ['github', 'github.com']
-    }
+    # Options set on the batch apply to every item unless the item overrides them
+    defaults = {key: value for key, value in request.items() if key not in ("items", "concurrency")}
+    entries = [parse_batch_item(index, item, defaults) for index, item in enumerate(items)]
+    concurrency = min(limit or BATCH_CONCURRENCY or task_registry.concurrency, task_registry.concurrency)
     
-    detected_website = 'google.com'  # Default
-    for site, keywords in website_patterns.items():
-        if any(keyword in instruction_lower for keyword in keywords):
-            detected_website = site if '.' in site else f"{site}.com"
-            parsed['website'] = detected_website
-            break
+    return StreamingResponse(stream_batch(entries, concurrency), media_type="application/x-ndjson")
+
+def parse_batch_item(index, item, defaults):
+    """Parse one batch item up front: (index, client key, parsed task or None, error or None)"""
+    if isinstance(item, str):
+        item = {"task": item}
+    elif not isinstance(item, dict):
+        return index, index, None, "Batch item must be an instruction or an object with a task"
+    key = item.get("id", index)
+    options = {"priority": BACKGROUND, **defaults, **item}
+    instruction = options.get("task")
+    if not instruction or not isinstance(instruction, str):
+        return index, key, None, "No task description provided"
     
-    if not parsed['website']:
-        parsed['website'] = detected_website
+    try:
+        parse_start = time.perf_counter()
+        parsed_task = parse_multi_step_instruction(instruction)
+        observe_stage('parse', parsed_task['website'], time.perf_counter() - parse_start)
+        apply_task_options(parsed_task, options)
+    except Exception as e:
+        return index, key, None, str(e)
+    # Items of a batch are independent of each other, so none supersedes another
+    parsed_task['session'] = None
+    return index, key, parsed_task, None
+
+async def stream_batch(entries, concurrency):
+    """Yield one NDJSON line per item in completion order, then a summary line"""
+    started = time.perf_counter()
+    pending = list(reversed(entries))
+    finished = asyncio.Queue()
+    # Tasks this batch created, cancelled if the client goes away before they finish
+    owned = set()
     
-    # Extract search queries with more comprehensive patterns
-    search_patterns = [
-        # Direct search patterns
-        r'search (?:for |)(.+?)(?:\s+and\s+|\s*$)',
-        r'look (?:for |up |)(.+?)(?:\s+and\s+|\s*$)',
-        r'find (.+?)(?:\s+and\s+|\s*$)',
-        r'google (.+?)(?:\s+and\s+|\s*$)',
-        
-        # Site-specific patterns  
-        r'(?:go to|visit|open)\s+\w+(?:\.com|)\s+(?:and\s+)?(?:search for|look for|find)\s+(.+?)(?:\s+and\s+|\s*$)',
-        r'(?:on|from)\s+\w+(?:\.com|)\s+(?:search for|look for|find)\s+(.+?)(?:\s+and\s+|\s*$)',
-        
-        # Shopping patterns
-        r'(?:look for|find|search for)\s+(.+?)\s+(?:under|below|less than|cheaper than)\s+[\$\d]+',
-        r'(?:look for|find|search for)\s+(.+?)\s+(?:on|at)\s+\w+',
-    ]
-    
-    import re
-    search_query = ""
-    for pattern in search_patterns:
-        match = re.search(pattern, instruction_lower)
-        if match:
-            search_query = match.group(1).strip()
-            # Clean up common words
-            search_query = re.sub(r'\s+(?:and|on|at|from|in|the)\s*$', '', search_query)
+    async def run_items():
+        while pending:
+            index, key, parsed_task, error = pending.pop()
+            line = {"type": "item", "index": index, "id": key}
+            if error:
+                line.update({"status": "error", "error": error})
+            else:
+                try:
+                    line.update(await run_batch_item(parsed_task, owned))
+                except Exception as e:
+                    # One bad item must not take the rest of the batch down with it
+                    logger.error(f"Batch item {key} failed: {e}")
+                    line.update({"status": "error", "error": str(e)})
+            finished.put_nowait(line)
+    
+    runners = [asyncio.create_task(run_items()) for _ in range(min(concurrency, len(entries)))]
+    succeeded = 0
+    try:
+        for _ in entries:
+            line = await finished.get()
+            succeeded += line["status"] == "success"
+            yield json.dumps(line, default=str) + "\n"
+        yield json.dumps({
+            "type": "summary",
+            "total": len(entries),
+            "succeeded": succeeded,
+            "failed": len(entries) - succeeded,
+            "duration_ms": round((time.perf_counter() - started) * 1000, 1),
+        }) + "\n"
+    finally:
+        for runner in runners:
+            runner.cancel()
+        await asyncio.gather(*runners, return_exceptions=True)
+        for task_id in list(owned):
+            record = task_registry.get(task_id)
+            # Another client that coalesced into the task still wants its result
+            if record is not None and not record.coalesced:
+                task_registry.cancel(task_id, reason="Batch client disconnected")
+
+async def run_batch_item(parsed_task, owned):
+    """Queue one batch item, waiting for room when the queue is full, and return its finished response"""
+    while True:
+        try:
+            response = await execute_browser_task(parsed_task)
             break
+        except QueueFullError as e:
+            await asyncio.sleep(e.retry_after)
     
-    parsed['search_query'] = search_query
-    
-    # Determine task type
-    if any(word in instruction_lower for word in ['shop', 'buy', 'purchase', 'price', 'cost', 'under', 'cheap']):
-        parsed['task_type'] = 'shopping'
-    elif any(word in instruction_lower for word in ['watch', 'video', 'tutorial', 'movie', 'show']):
-        parsed['task_type'] = 'media'
-    elif any(word in instruction_lower for word in ['weather', 'forecast', 'temperature']):
-        parsed['task_type'] = 'weather'
-    elif any(word in instruction_lower for word in ['news', 'article', 'read']):
-        parsed['task_type'] = 'information'
-    
-    # Extract actions
-    if 'click' in instruction_lower:
-        if any(phrase in instruction_lower for phrase in ['first link', 'first result', 'top result']):
-            parsed['actions'].append('click_first_result')
-        elif 'first' in instruction_lower:
-            parsed['actions'].append('click_first_result')
-        else:
-            parsed['actions'].append('click_link')
+    task_id = response["task_id"]
+    if not response.get("coalesced"):
+        owned.add(task_id)
+    try:
+        await add_task_outcome(response, None)
+    finally:
+        owned.discard(task_id)
+    return response
+
+async def start_agent_task(request):
+    """Parse and queue a browser task, or hand it back to the LLM; shared by HTTP and WebSocket"""
+    # Get the task description from the request
+    task_description = request.get("task", "")
+    use_browser = request.get("use_browser", False)
     
-    # Add browse action if no specific search query but going to a site
-    if not search_query and any(phrase in instruction_lower for phrase in ['go to', 'visit', 'open', 'browse']):
-        parsed['actions'].append('navigate_and_browse')
+    logger.info(f"Executing agent task: {task_description}")
+    logger.info(f"Use browser: {use_browser}")
     
-    return parsed
+    if not task_description:
+        return {
+            "status": "error", 
+            "error": "No task description provided"
+        }
+    
+    if use_browser:
+        # Parse the task and execute browser automation
+        parse_start = time.perf_counter()
+        # Opt-in: a compound instruction ("compare X on amazon and ebay") becomes one sub-task per site and query
+        parsed_tasks = parse_fan_out(task_description) if request.get("fan_out", False) else None
+        if not parsed_tasks:
+            parsed_tasks = [parse_multi_step_instruction(task_description)]
+        observe_stage('parse', parsed_tasks[0]['website'], time.perf_counter() - parse_start)
+        for parsed_task in parsed_tasks:
+            apply_task_options(parsed_task, request)
+            logger.info(f"Parsed task: {parsed_task}")
+        
+        if len(parsed_tasks) > 1:
+            return await execute_fan_out(parsed_tasks, request.get("session"))
+        return await execute_browser_task(parsed_tasks[0])
+    
+    # Return response indicating this should be handled by LLM
+    logger.info(f"Task identified as LLM-suitable: {task_description}")
+    return {
+        "status": "llm_response",
+        "result": {
+            "message": "This question can be answered directly by the AI assistant",
+            "task": task_description,
+            "use_llm": True,
+            "summary": f"Please use the LLM to answer: {task_description}"
+        }
+    }
+
+def apply_task_options(parsed_task, request):
+    """Copy a request's per-task options onto a parsed task"""
+    parsed_task['latency_profile'] = get_latency_profile(request.get("latency_profile")).name
+    parsed_task['block_resources'] = resolve_block_mode(
+        request.get("block_resources"), SITES.get(parsed_task['website']).block_resources
+    )
+    # "trace": true records timings and metrics, "full" adds a Playwright trace archive
+    trace = request.get("trace")
+    parsed_task['trace'] = 'full' if trace == 'full' else ('basic' if trace else None)
+    # A traced task is meant to show a real run, so it never replays from cache
+    parsed_task['use_cache'] = not (request.get("bypass_cache", False) or trace)
+    # Duplicates of a task already in flight share its run unless the client opts out
+    parsed_task['coalesce'] = bool(request.get("coalesce", True)) and not trace
+    # A new interactive command from a session supersedes that session's older tasks
+    parsed_task['session'] = request.get("session")
+    parsed_task['priority'] = request.get("priority", INTERACTIVE)
+
+@app.get("/agent/tasks/{task_id}")
+async def get_agent_task(task_id: str):
+    """Return status and, once finished, the result of a browser task"""
+    record = task_registry.get(task_id)
+    if record is None:
+        return JSONResponse(status_code=404, content={"status": "error", "error": f"Unknown task: {task_id}"})
+    return record.to_dict()
+
+@app.post("/agent/tasks/{task_id}/cancel")
+async def cancel_agent_task(task_id: str):
+    """Cancel a queued or running browser task"""
+    record = task_registry.cancel(task_id)
+    if record is None:
+        return JSONResponse(status_code=404, content={"status": "error", "error": f"Unknown task: {task_id}"})
+    return record.to_dict()
+
+@app.get("/agent/traces")
+async def list_traces():
+    """Saved task traces, newest first"""
+    return {"traces": trace_store.list()}
+
+@app.get("/agent/traces/{task_id}")
+async def get_trace(task_id: str):
+    """Timeline, stage timings, network timings and Chromium metrics recorded for a task"""
+    trace = trace_store.get(task_id)
+    if trace is None:
+        return JSONResponse(status_code=404, content={"status": "error", "error": f"No trace for task: {task_id}"})
+    return trace
+
+@app.get("/agent/traces/{task_id}/{name}")
+async def get_trace_artifact(task_id: str, name: str):
+    """A screenshot or Playwright trace archive saved with a task's trace"""
+    path = trace_store.artifact(task_id, name)
+    if path is None:
+        return JSONResponse(status_code=404, content={"status": "error", "error": f"No {name} for task: {task_id}"})
+    return FileResponse(path)
 
 async def execute_browser_task(parsed_task):
     """Execute browser automation based on parsed task with multi-site support"""
@@ -215,53 +478,56 @@ async def execute_browser_task(parsed_task):
     logger.info(f"Performing {task_type} task on {website}")
     logger.info(f"Search query: '{search_query}', Actions: {actions}")
     
-    # Start browser task in background (don't wait for completion)
-    asyncio.create_task(run_browser_automation(parsed_task))
+    # Queue the browser task; raises QueueFullError when the daemon is saturated
+    metadata = {"website": website, "search_query": search_query, "actions": actions, "task_type": task_type}
+    key = task_cache_key(parsed_task) if parsed_task.get('coalesce', True) else None
+    # A client bypassing the cache still shares a run in flight, but not one that already finished
+    reuse_finished = parsed_task.get('use_cache', True)
+    shared = task_registry.find_coalescable(key, reuse_finished) if key else None
+    # A duplicate attaches to the existing task, so it needs no cache lookup either
+    cached = None if shared else lookup_cached_result(parsed_task)
+    if cached:
+        # Seen recently: just reopen the known final URL
+        func, args, metadata = open_cached_result, (parsed_task, cached), {**metadata, "cached": True}
+    else:
+        func, args = run_browser_automation, (parsed_task,)
+    record = task_registry.submit(
+        func, *args, metadata=metadata, key=key, reuse_finished=reuse_finished,
+        session=parsed_task.get('session'), priority=parsed_task.get('priority', INTERACTIVE)
+    )
+    if shared:
+        TASKS_COALESCED.inc(website)
     
     # Generate appropriate response based on task
     if website == 'google.com' or not website:
         # Google search responses
         if 'click_first_result' in actions:
-            return {
+            response = {
                 "status": "success",
                 "result": {
                     "search_query": search_query,
                     "summary": f"I'm opening Google, searching for '{search_query}', and clicking the first result. This will happen in your browser shortly.",
                     "message": "Browser automation initiated",
-                    "url": f"https://google.com/search?q={search_query.replace(' ', '+')}" if search_query else "https://google.com",
+                    "url": SITES.get('google.com').search_url_for(search_query) or SITES.get('google.com').base_url,
                     "action": "search_and_click"
                 }
             }
         else:
-            return {
+            response = {
                 "status": "success", 
                 "result": {
                     "search_query": search_query,
                     "summary": f"I'm opening Google and searching for '{search_query}'. This will happen in your browser shortly.",
                     "message": "Browser automation initiated", 
-                    "url": f"https://google.com/search?q={search_query.replace(' ', '+')}" if search_query else "https://google.com",
+                    "url": SITES.get('google.com').search_url_for(search_query) or SITES.get('google.com').base_url,
                     "action": "search_only"
                 }
             }
     
     else:
         # Other website responses
-        base_urls = {
-            'maps.google.com': 'https://maps.google.com',
-            'amazon.com': 'https://amazon.com',
-            'youtube.com': 'https://youtube.com', 
-            'netflix.com': 'https://netflix.com',
-            'wikipedia.org': 'https://wikipedia.org',
-            'expedia.com': 'https://expedia.com',
-            'weather.com': 'https://weather.com',
-            'ebay.com': 'https://ebay.com',
-            'facebook.com': 'https://facebook.com',
-            'twitter.com': 'https://twitter.com',
-            'reddit.com': 'https://reddit.com',
-            'github.com': 'https://github.com'
-        }
-        
-        base_url = base_urls.get(website, f"https://{website}")
+        site = SITES.get(website)
+        base_url = site.search_url_for(search_query) or site.base_url
         
         if search_query:
             if task_type == 'shopping':
@@ -275,7 +541,7 @@ async def execute_browser_task(parsed_task):
         else:
             summary = f"I'm opening {website} for you to browse. This will happen in your browser shortly."
         
-        return {
+        response = {
             "status": "success",
             "result": {
                 "search_query": search_query,
@@ -287,261 +553,542 @@ async def execute_browser_task(parsed_task):
                 "action": "navigate_and_search" if search_query else "navigate"
             }
         }
+    
+    if cached:
+        # The cached result already answers the task, no need to wait for the browser
+        response["result"].update({
+            "summary": summarize_task_result(cached["result"]),
+            "message": "Answered from cache, reopening the result in your browser",
+            "outcome": cached["result"]["outcome"],
+            "final_url": cached["result"]["final_url"],
+            "extraction": cached["result"]["extraction"],
+            "cached": True,
+            "cached_at": cached["stored_at"],
+        })
+    
+    if shared:
+        response["coalesced"] = True
+        if shared.finished:
+            # Debounced repeat of a task that just finished: its outcome is already known
+            response["task_id"] = shared.task_id
+            await add_task_outcome(response, 0)
+        else:
+            response["result"]["message"] = "Same task already in progress, sharing its result"
+    
+    response["task_id"] = record.task_id
+    response["status_url"] = f"/agent/tasks/{record.task_id}"
+    return response
 
-async def get_or_create_browser():
-    """Get existing browser or create new one if needed"""
-    global global_browser, global_page, global_playwright
+async def execute_fan_out(parsed_tasks, session=None):
+    """Run each sub-task of a compound instruction concurrently and track them as one group task"""
+    responses = []
+    try:
+        for parsed_task in parsed_tasks:
+            # The group carries the session, so sibling sub-tasks don't supersede each other
+            responses.append(await execute_browser_task({**parsed_task, 'session': None}))
+    except QueueFullError:
+        for response in responses:
+            record = task_registry.get(response["task_id"])
+            # A sub-task that joined, or was joined by, another client's task keeps running for them
+            if response.get("coalesced") or record is None or record.coalesced or record.sessions:
+                continue
+            task_registry.cancel(record.task_id, reason="Rest of the fan-out was rejected")
+        raise
     
-    # Check if we have a working browser
-    if global_browser and global_page:
-        try:
-            # Test if browser is still alive by checking the page
-            await global_page.evaluate("() => document.readyState")
-            logger.info("Reusing existing browser window")
-            return global_browser, global_page
-        except Exception as e:
-            logger.info(f"Existing browser is no longer valid: {e}")
-            global_browser = None
-            global_page = None
-    
-    # Create new browser if needed
-    logger.info("Creating new browser window")
-    
-    # Start Playwright if needed
-    if not global_playwright:
-        global_playwright = await async_playwright().start()
-    
-    # Launch browser with user agent to avoid detection
-    global_browser = await global_playwright.chromium.launch(
-        headless=False,
-        args=[
-            '--disable-blink-features=AutomationControlled',
-            '--disable-web-security',
-            '--disable-features=VizDisplayCompositor'
-        ]
-    )
-    context = await global_browser.new_context(
-        user_agent='Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36'
+    children = [task_registry.get(response["task_id"]) for response in responses]
+    websites = list(dict.fromkeys(parsed_task['website'] for parsed_task in parsed_tasks))
+    queries = list(dict.fromkeys(parsed_task['search_query'] for parsed_task in parsed_tasks))
+    group = task_registry.submit_group(
+        children, merge_fan_out_results, session=session,
+        metadata={"fan_out": True, "websites": websites, "search_queries": queries}
     )
-    global_page = await context.new_page()
     
-    # Add script to remove webdriver detection
-    await global_page.add_init_script("""
-        Object.defineProperty(navigator, 'webdriver', {
-            get: () => undefined,
-        });
-    """)
+    return {
+        "status": "success",
+        "result": {
+            "summary": f"I'm running {len(children)} searches at once on {', '.join(websites)}. This will happen in your browser shortly.",
+            "message": "Parallel browser automation initiated",
+            "action": "fan_out",
+            "sub_tasks": [
+                {
+                    "task_id": response["task_id"],
+                    "website": parsed_task['website'],
+                    "search_query": parsed_task['search_query'],
+                    "url": response["result"]["url"],
+                    "status_url": response["status_url"],
+                }
+                for parsed_task, response in zip(parsed_tasks, responses)
+            ],
+        },
+        "task_id": group.task_id,
+        "status_url": f"/agent/tasks/{group.task_id}",
+    }
+
+def merge_fan_out_results(children):
+    """One result for a fan-out group: every sub-task's outcome and extraction, in instruction order"""
+    results = []
+    for child in children:
+        result = child.result or {}
+        results.append({
+            "task_id": child.task_id,
+            "website": child.metadata.get("website"),
+            "search_query": child.metadata.get("search_query"),
+            "status": child.status,
+            "error": child.error,
+            "outcome": result.get("outcome"),
+            "final_url": result.get("final_url"),
+            "extraction": result.get("extraction"),
+            "cached": result.get("cached", False),
+            "duration_ms": result.get("duration_ms"),
+        })
+    succeeded = [entry for entry in results if entry["outcome"] == 'success']
+    return {
+        "fan_out": True,
+        "outcome": 'success' if succeeded else 'error',
+        "results": results,
+    }
+
+def summarize_fan_out(result):
+    """Plain-text account of every site a fan-out searched, for the LLM"""
+    lines = []
+    for entry in result["results"]:
+        label = f"{entry['website']}" + (f" for '{entry['search_query']}'" if entry['search_query'] else "")
+        extraction = entry["extraction"]
+        if entry["outcome"] != 'success':
+            lines.append(f"{label}: stopped with {entry['outcome'] or entry['status']}" + (f" ({entry['error']})" if entry['error'] else ""))
+        elif extraction and extraction["results"]:
+            lines.append(f"{label}:")
+            for item in extraction["results"][:3]:
+                lines.append(f"  {item['rank'] + 1}. {item['title']} - {item['url']}")
+        else:
+            lines.append(f"{label}: opened {entry['final_url']}")
+    return "\n".join(lines)
+
+def task_cache_key(parsed_task):
+    return cache_key(parsed_task['website'], parsed_task['search_query'], parsed_task['actions'])
+
+def lookup_cached_result(parsed_task):
+    """Fresh cache entry for a search task, or None on a miss, bypass or browse-only task"""
+    website = parsed_task['website']
+    if not parsed_task['search_query'] or not result_cache.enabled:
+        return None
+    if not parsed_task.get('use_cache', True):
+        RESULT_CACHE_LOOKUPS.inc(website, 'bypass')
+        return None
+    entry = result_cache.get(task_cache_key(parsed_task))
+    RESULT_CACHE_LOOKUPS.inc(website, 'hit' if entry else 'miss')
+    return entry
+
+async def add_task_outcome(response, timeout):
+    """Fold a finished task's outcome and extracted results into its /agent/run response"""
+    record = task_registry.get(response["task_id"])
+    if record is None or not await record.wait(timeout):
+        # Still running; the client can follow status_url
+        return
+    
+    response["task_status"] = record.status
+    result = record.result
+    if result and result.get("fan_out"):
+        # Sites that failed are listed alongside the ones that answered
+        response["result"].update({
+            "summary": summarize_fan_out(result),
+            "message": "Parallel browser automation finished",
+            "outcome": result["outcome"],
+            "results": result["results"],
+        })
+    if record.status != SUCCEEDED:
+        response["status"] = "error"
+        response["error"] = record.error
+        return
+    if result.get("fan_out"):
+        return
+    
+    response["result"].update({
+        "summary": summarize_task_result(result),
+        "message": "Browser automation finished",
+        "outcome": result["outcome"],
+        "final_url": result["final_url"],
+        "extraction": result["extraction"],
+        "cached": result.get("cached", False),
+    })
+
+def summarize_task_result(result):
+    """Plain-text account of what a finished browser task found, for the LLM"""
+    if result["outcome"] != 'success':
+        return f"The browser task on {result['website']} stopped with outcome '{result['outcome']}' at {result['final_url']}."
+    
+    lines = []
+    extraction = result.get("extraction")
+    if extraction and extraction["results"]:
+        lines.append(f"Top results for '{result['search_query']}' on {result['website']}:")
+        for item in extraction["results"][:5]:
+            lines.append(f"{item['rank'] + 1}. {item['title']} - {item['url']}")
+    if 'click_first_result' in result["actions"]:
+        lines.append(f"Opened the first result: {result['final_url']}")
+    if not lines:
+        lines.append(f"Opened {result['final_url']} in your browser.")
+    return "\n".join(lines)
+
+def is_captcha_url(url):
+    """True when the page has been redirected to a CAPTCHA / bot check"""
+    return 'sorry' in url or 'captcha' in url.lower()
+
+def timeout_or_error(exc):
+    """Classify a failed step for outcome metrics"""
+    return 'timeout' if isinstance(exc, PlaywrightTimeoutError) else 'error'
+
+class BrowserRun:
+    """A task's leased page and the outcome counted for it when the run ends"""
+    
+    def __init__(self):
+        self.page = None
+        self.outcome = 'error'
+
+@asynccontextmanager
+async def browser_run(parsed_task, blocker, trace=None):
+    """
+    Lease a pooled page for a task with resource blocking and tracing attached.
     
-    return global_browser, global_page
+    The run's outcome is counted in TASK_OUTCOMES however the block exits:
+    the caller sets `run.outcome` when it finishes, failures are classified here.
+    """
+    website = parsed_task['website']
+    run = BrowserRun()
+    try:
+        acquire_start = time.perf_counter()
+        async with browser_pool.lease() as page:
+            observe_stage('acquire', website, time.perf_counter() - acquire_start)
+            
+            # Skip images, fonts, trackers etc. the automation doesn't need
+            scope = browser_pool.task_scope(page)
+            recording = trace.recording(page, trace_store, scope) if trace is not None else nullcontext()
+            async with recording, blocker.attached(scope, page):
+                run.page = page
+                yield run
+    except asyncio.CancelledError:
+        run.outcome = 'cancelled'
+        raise
+    except PoolTimeoutError as e:
+        run.outcome = 'timeout'
+        logger.warning(f"Browser pool exhausted: {e}")
+        raise
+    except Exception as e:
+        run.outcome = timeout_or_error(e)
+        raise
+    finally:
+        TASK_OUTCOMES.inc(website, run.outcome)
 
 async def run_browser_automation(parsed_task):
     """Run fast browser automation with support for multiple websites and task types"""
+    search_query = parsed_task['search_query']
+    actions = parsed_task['actions'] 
+    website = parsed_task['website']
+    task_type = parsed_task['task_type']
+    extraction = None
+    result = None
+    task_start = time.perf_counter()
+    record = current_task()
+    trace = TaskTrace(record.task_id if record else uuid.uuid4().hex, parsed_task.get('trace'))
+    trace.activate()
     try:
-        search_query = parsed_task['search_query']
-        actions = parsed_task['actions'] 
-        website = parsed_task['website']
-        task_type = parsed_task['task_type']
+        profile = get_latency_profile(parsed_task.get('latency_profile'))
+        blocker = ResourceBlocker(resolve_block_mode(
+            parsed_task.get('block_resources'), SITES.get(website).block_resources
+        ))
         
-        logger.info(f"Starting browser automation for {task_type} on {website}")
+        logger.info(f"Starting browser automation for {task_type} on {website} ({profile.name} profile)")
         logger.info(f"Search query: '{search_query}', Actions: {actions}")
         
-        # Get or create browser - this will reuse existing browser if available
-        browser, page = await get_or_create_browser()
+        async with browser_run(parsed_task, blocker, trace) as run:
+            page = run.page
+            # Navigate to appropriate website
+            is_google = website == 'google.com' or not website
+            if is_google:
+                outcome = await handle_google_automation(page, search_query, profile)
+            else:
+                outcome = await handle_other_site_automation(page, website, search_query, task_type, actions, profile)
+            
+            # Snapshot the results page in one round trip; the click below acts on it
+            if outcome == 'success' and search_query:
+                extraction = await extract_task_results(page, 'google.com' if is_google else website)
+            
+            # Handle click actions
+            if outcome == 'success' and is_google and 'click_first_result' in actions:
+                outcome = await click_first_google_result(page, profile, extraction)
+            run.outcome = outcome
+            final_url = page.url
         
-        # Navigate to appropriate website
-        if website == 'google.com' or not website:
-            await handle_google_automation(page, search_query, actions)
-        else:
-            await handle_other_site_automation(page, website, search_query, task_type, actions)
+        for resource_type, count in blocker.blocked_by_type.items():
+            BLOCKED_REQUESTS.inc(website, resource_type, amount=count)
         
-        logger.info("Task completed successfully - browser will remain open permanently")
-        logger.info("Browser and page will stay open for user interaction")
+        logger.info(f"Task finished with outcome '{outcome}' - page stays open until its pool slot is reused")
+        result = {
+            "website": website,
+            "search_query": search_query,
+            "actions": actions,
+            "final_url": final_url,
+            "outcome": outcome,
+            "extraction": extraction,
+            "resources": blocker.summary(),
+            "duration_ms": round((time.perf_counter() - task_start) * 1000, 1)
+        }
         
+        if outcome == 'success' and search_query:
+            result_cache.put(task_cache_key(parsed_task), result, ttl_for(task_type, SITES.get(website).cache_ttl))
+        if trace.enabled:
+            result = {**result, "trace_url": f"/agent/traces/{trace.task_id}"}
+        return result
+        
+    except Exception as e:
+        if not isinstance(e, PoolTimeoutError):
+            logger.error(f"Browser automation error: {e}")
+            logger.info("Browser left open for manual completion if available")
+        raise
+    finally:
+        # Written in the background once screenshots are in and the task has finished
+        trace_store.save_later(trace, record, result)
+
+async def open_cached_result(parsed_task, entry):
+    """Replay a cached task by opening its final URL directly; returns the cached result"""
+    website = parsed_task['website']
+    cached = entry['result']
+    task_start = time.perf_counter()
+    blocker = ResourceBlocker(resolve_block_mode(
+        parsed_task.get('block_resources'), SITES.get(website).block_resources
+    ))
+    try:
+        async with browser_run(parsed_task, blocker) as run:
+            logger.info(f"Reopening cached result for '{parsed_task['search_query']}': {cached['final_url']}")
+            report_progress('navigating', url=cached['final_url'], cached=True)
+            with timed_stage('goto', website):
+                await run.page.goto(cached['final_url'], wait_until='domcontentloaded')
+            run.outcome = 'success'
+            final_url = run.page.url
+    except Exception as e:
+        if not isinstance(e, PoolTimeoutError):
+            # Don't keep replaying a URL that no longer loads
+            result_cache.invalidate(task_cache_key(parsed_task))
+            logger.error(f"Could not reopen cached result: {e}")
+        raise
+    
+    return {
+        **cached,
+        "final_url": final_url,
+        "resources": blocker.summary(),
+        "duration_ms": round((time.perf_counter() - task_start) * 1000, 1),
+        "cached": True,
+        "cached_at": entry['stored_at'],
+        "original_duration_ms": cached.get('duration_ms'),
+    }
+
+async def extract_task_results(page, website):
+    """Ranked results on the current page, or None if extraction failed"""
+    try:
+        with timed_stage('extract', website):
+            extraction = await extract_results(page, SITES.get(website).result_selectors)
     except Exception as e:
-        logger.error(f"Browser automation error: {e}")
-        logger.info("Browser left open for manual completion if available")
+        logger.warning(f"Result extraction failed on {website}: {e}")
+        return None
+    report_progress('extracted', results=len(extraction['results']))
+    return extraction
 
-async def handle_google_automation(page, search_query, actions):
-    """Handle Google search automation"""
-    logger.info("Navigating to Google...")
-    await page.goto("https://www.google.com", wait_until='domcontentloaded')
+async def handle_google_automation(page, search_query, profile):
+    """Handle Google search automation; returns the task outcome"""
+    site = SITES.get('google.com')
+    direct_url = site.search_url_for(search_query) if profile.direct_search else None
+    
+    logger.info(f"Navigating to {direct_url or site.base_url}")
+    report_progress('navigating', url=direct_url or site.base_url)
+    with timed_stage('goto', 'google.com'):
+        await page.goto(direct_url or site.base_url, wait_until='domcontentloaded')
     
     # Check for CAPTCHA
-    current_url = page.url
-    if 'sorry' in current_url or 'captcha' in current_url.lower():
+    if is_captcha_url(page.url):
         logger.warning("Google CAPTCHA detected - leaving browser open for manual completion")
-        return
+        return 'captcha'
     
-    if search_query:
+    if direct_url:
+        # Went straight to the results page; just wait for results to render
+        try:
+            await page.wait_for_selector('div#search', timeout=NAVIGATION_TIMEOUT)
+            logger.info("Search results loaded")
+        except Exception as search_error:
+            if is_captcha_url(page.url):
+                logger.warning("Google CAPTCHA appeared during search")
+                return 'captcha'
+            logger.error(f"Search error: {search_error}")
+            return timeout_or_error(search_error)
+    
+    elif search_query:
         logger.info(f"Searching for: {search_query}")
+        report_progress('searching', query=search_query)
         try:
-            search_box = await page.wait_for_selector('textarea[name="q"], input[name="q"]', timeout=10000)
-            await search_box.click()
-            await page.wait_for_timeout(500)
-            await search_box.type(search_query, delay=100)
-            await page.wait_for_timeout(300)
-            await search_box.press("Enter")
-            
-            # Wait for results
-            await page.wait_for_selector('div#search', timeout=0)
+            with timed_stage('search_box', 'google.com'):
+                search_box = await page.wait_for_selector(', '.join(site.search_selectors), timeout=10000)
+        except Exception as search_error:
+            if is_captcha_url(page.url):
+                logger.warning("Google CAPTCHA appeared during search")
+                return 'captcha'
+            logger.error(f"Search box not found: {search_error}")
+            return 'selector_not_found'
+        
+        try:
+            with timed_stage('type_submit', 'google.com'):
+                await enter_text(page, search_box, search_query, profile)
+                await search_box.press("Enter")
+                
+                # Wait for results
+                await page.wait_for_selector('div#search', timeout=NAVIGATION_TIMEOUT)
             logger.info("Search results loaded")
             
         except Exception as search_error:
-            current_url = page.url
-            if 'sorry' in current_url or 'captcha' in current_url.lower():
+            if is_captcha_url(page.url):
                 logger.warning("Google CAPTCHA appeared during search")
-                return
+                return 'captcha'
             else:
                 logger.error(f"Search error: {search_error}")
-                return
-    
-    # Handle click actions
-    if 'click_first_result' in actions:
-        await click_first_google_result(page)
-
-async def handle_other_site_automation(page, website, search_query, task_type, actions):
-    """Handle automation for other websites"""
-    # Website URL mapping
-    base_urls = {
-        'maps.google.com': 'https://maps.google.com',
-        'amazon.com': 'https://amazon.com',
-        'youtube.com': 'https://youtube.com',
-        'netflix.com': 'https://netflix.com', 
-        'wikipedia.org': 'https://wikipedia.org',
-        'expedia.com': 'https://expedia.com',
-        'weather.com': 'https://weather.com',
-        'ebay.com': 'https://ebay.com',
-        'facebook.com': 'https://facebook.com',
-        'twitter.com': 'https://twitter.com',
-        'reddit.com': 'https://reddit.com',
-        'github.com': 'https://github.com'
-    }
+                return timeout_or_error(search_error)
+    
+    return 'success'
+
+async def handle_other_site_automation(page, website, search_query, task_type, actions, profile):
+    """Handle automation for other websites; returns the task outcome"""
+    site = SITES.get(website)
     
-    base_url = base_urls.get(website, f"https://{website}")
-    logger.info(f"Navigating to {base_url}")
+    # Sites with a search-URL template skip the homepage and the typing sequence
+    direct_url = site.search_url_for(search_query) if profile.direct_search else None
+    target_url = direct_url or site.base_url
+    logger.info(f"Navigating to {target_url}")
+    report_progress('navigating', url=target_url)
     
     try:
-        await page.goto(base_url, wait_until='domcontentloaded')
-        await page.wait_for_timeout(2000)  # Let page fully load
+        with timed_stage('goto', website):
+            await page.goto(target_url, wait_until='domcontentloaded')
+        await profile.pause(page, 'after_goto')
         
-        if search_query:
+        if direct_url:
+            logger.info(f"Opened {website} results for '{search_query}' directly")
+            return 'success'
+        elif search_query:
             # Try to find and use search functionality on the site
-            await perform_site_search(page, website, search_query, task_type)
+            return await perform_site_search(page, website, search_query, task_type, profile)
         else:
             logger.info(f"Simply opened {website} for browsing")
+            return 'success'
             
     except Exception as e:
         logger.error(f"Error navigating to {website}: {e}")
+        return timeout_or_error(e)
 
-async def perform_site_search(page, website, search_query, task_type):
-    """Attempt to search on various websites"""
+async def perform_site_search(page, website, search_query, task_type, profile):
+    """Attempt to search on various websites; returns the task outcome"""
     try:
-        # Common search selectors by site
-        search_selectors = {
-            'maps.google.com': ['input[id="searchboxinput"]', 'input[placeholder*="Search"]', 'input[aria-label*="Search"]'],
-            'amazon.com': ['input[name="field-keywords"]', '#twotabsearchtextbox', 'input[type="text"][placeholder*="Search"]'],
-            'youtube.com': ['input[name="search_query"]', '#search', 'input[placeholder*="Search"]'],
-            'wikipedia.org': ['input[name="search"]', '#searchInput', 'input[placeholder*="Search"]'],
-            'ebay.com': ['input[name="_nkw"]', 'input[placeholder*="Search"]'],
-            'reddit.com': ['input[name="q"]', 'input[placeholder*="Search"]'],
-            'github.com': ['input[name="q"]', 'input[placeholder*="Search"]']
-        }
+        selectors = SITES.get(website).search_selectors
         
-        selectors = search_selectors.get(website, ['input[type="search"]', 'input[name="q"]', 'input[placeholder*="Search"]'])
-        
-        search_box = None
-        for selector in selectors:
-            try:
-                search_box = await page.wait_for_selector(selector, timeout=3000)
-                if search_box:
-                    logger.info(f"Found search box with selector: {selector}")
-                    break
-            except:
-                continue
+        # Race all candidates, giving the selector that won last time a head start
+        with timed_stage('search_box', website):
+            selector, search_box = await race_selectors(
+                page, selectors, timeout=3000, preferred=selector_memory.preferred(website, 'search_box')
+            )
         
         if search_box:
-            await search_box.click()
-            await page.wait_for_timeout(500)
-            
-            # Clear existing text and type search query
-            await search_box.fill("")  # Clear the field
-            await page.wait_for_timeout(200)
-            await search_box.type(search_query, delay=100)
-            await page.wait_for_timeout(300)
-            
-            # Try to submit the search
-            await search_box.press("Enter")
+            logger.info(f"Found search box with selector: {selector}")
+            selector_memory.record(website, 'search_box', selector)
+            report_progress('searching', query=search_query)
+            with timed_stage('type_submit', website):
+                # Replace any existing text with the search query
+                await enter_text(page, search_box, search_query, profile)
+                
+                # Submit the search and wait for the results page
+                await submit_and_wait(page, search_box, profile)
             logger.info(f"Searched for '{search_query}' on {website}")
-            
-            # Wait for results to load
-            await page.wait_for_timeout(3000)
+            return 'success'
             
         else:
             logger.warning(f"Could not find search box on {website}")
             # If no search found, try Google search as fallback
-            google_search_url = f"https://www.google.com/search?q=site:{website}+{search_query.replace(' ', '+')}"
+            google_search_url = SITES.get('google.com').search_url_for(f"site:{website} {search_query}")
             logger.info(f"Falling back to Google site search: {google_search_url}")
             await page.goto(google_search_url)
+            return 'selector_not_found'
             
     except Exception as e:
         logger.error(f"Error performing search on {website}: {e}")
+        return timeout_or_error(e)
 
-async def click_first_google_result(page):
-    """Click the first result on Google search results"""
+async def click_first_google_result(page, profile, extraction=None):
+    """Click the first result on Google search results; returns the task outcome"""
     logger.info("Clicking first search result...")
+    click_start = time.perf_counter()
     try:
-        await page.wait_for_timeout(2000)
+        await profile.pause(page, 'before_click_result')
         
-        selectors_to_try = [
-            'div#search h3 a',
-            'div#search a:has(h3)',
-            'div#search a[href*="http"]:not([href*="google.com"]):not([href*="ads"]):not([role="button"])',
-            'div[data-hveid] a[href*="http"]:not([href*="google.com"])',
-            '#search .g a:first-child',
-            '.g .yuRUbf a',
-        ]
-        
-        first_result = None
-        for selector in selectors_to_try:
-            logger.info(f"Trying selector: {selector}")
-            first_result = await page.query_selector(selector)
-            if first_result:
-                is_visible = await first_result.is_visible()
-                if is_visible:
-                    logger.info(f"Found clickable element with selector: {selector}")
-                    break
-                else:
-                    first_result = None
-        
-        if first_result:
-            await first_result.scroll_into_view_if_needed()
-            await page.wait_for_timeout(500)
+        target = first_clickable(extraction)
+        if target:
+            # The extraction already checked visibility and tagged the link; click scrolls it into view
+            href = target['url']
+            click = functools.partial(page.click, result_selector(target['rank']), timeout=5000)
+        else:
+            # Nothing clickable in the snapshot; fall back to racing known result layouts
+            selectors_to_try = [
+                'div#search h3 a',
+                'div#search a:has(h3)',
+                'div#search a[href*="http"]:not([href*="google.com"]):not([href*="ads"]):not([role="button"])',
+                'div[data-hveid] a[href*="http"]:not([href*="google.com"])',
+                '#search .g a:first-child',
+                '.g .yuRUbf a',
+            ]
             
-            href = await first_result.get_attribute('href')
-            logger.info(f"Clicking first result: {href}")
+            # First visible match wins; the remaining waits are cancelled
+            selector, first_result = await race_selectors(
+                page, selectors_to_try, timeout=5000, preferred=selector_memory.preferred('google.com', 'first_result')
+            )
             
-            await first_result.click()
-            logger.info("Successfully clicked first result")
-            await page.wait_for_timeout(2000)
-        else:
-            logger.warning("Could not find any clickable first result")
-            await page.screenshot(path='/tmp/google_search_debug.png')
-            logger.info("Debug screenshot saved")
+            if not first_result:
+                logger.warning("Could not find any clickable first result")
+                capture_screenshot(page, 'no_clickable_result')
+                return 'selector_not_found'
+            
+            logger.info(f"Found clickable element with selector: {selector}")
+            selector_memory.record('google.com', 'first_result', selector)
+            await first_result.scroll_into_view_if_needed()
+            await profile.pause(page, 'after_scroll')
+            href = await first_result.get_attribute('href')
+            click = first_result.click
+        
+        logger.info(f"Clicking first result: {href}")
+        previous_url = page.url
+        await click()
+        await wait_for_url_change(page, previous_url)
+        logger.info("Successfully clicked first result")
+        report_progress('clicked', url=href)
+        await profile.pause(page, 'after_click')
+        return 'success'
             
     except Exception as click_error:
         logger.warning(f"Could not click first result: {click_error}")
-        try:
-            await page.screenshot(path='/tmp/click_error_debug.png')
-        except:
-            pass
+        capture_screenshot(page, 'click_error')
+        return timeout_or_error(click_error)
+    finally:
+        observe_stage('click_result', 'google.com', time.perf_counter() - click_start)
 
 if __name__ == "__main__":
-    logger.info("Starting Orbit Agent Server...")
-    
-    # Run the server on port 4823 to match agentClient expectations
-    uvicorn.run(
-        app,
-        host="127.0.0.1",
-        port=4823,
-        log_level="info"
-    )
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Orbit Agent Server")
+    parser.add_argument("--host", default="127.0.0.1")
+    # Port 4823 matches agentClient expectations
+    parser.add_argument("--port", type=int, default=4823)
+    parser.add_argument("--workers", type=int, default=int(os.environ.get('AGENT_WORKERS', '1')),
+                        help="headless worker processes behind a dispatcher; 1 runs a single headed server")
+    args = parser.parse_args()
+    
+    if args.workers > 1:
+        import worker_dispatcher
+        worker_dispatcher.run(args.host, args.port, args.workers)
+    else:
+        logger.info("Starting Orbit Agent Server...")
+        uvicorn.run(
+            app,
+            host=args.host,
+            port=args.port,
+            log_level="info"
+        )
\ No newline at end of file
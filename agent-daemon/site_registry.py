@@ -0,0 +1,105 @@
+"""
+Site registry for the Orbit Agent Server
+Single source of site keywords, URLs, search and result selectors and search-URL templates
+"""
+
+import json
+import logging
+import os
+from urllib.parse import quote_plus
+
+logger = logging.getLogger(__name__)
+
+SITES_PATH = os.environ.get(
+    'AGENT_SITES_PATH',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'sites.json')
+)
+
+
+class Site:
+    """One website the agent knows how to drive"""
+
+    def __init__(self, domain, base_url, keywords=(), search_selectors=(), search_url=None, block_resources=None,
+                 result_selectors=(), cache_ttl=None):
+        self.domain = domain
+        self.base_url = base_url
+        self.keywords = list(keywords)
+        self.search_selectors = list(search_selectors)
+        self.result_selectors = list(result_selectors)
+        self.cache_ttl = cache_ttl
+        self.search_url = search_url
+        self.block_resources = block_resources
+
+    def search_url_for(self, query):
+        """Direct results URL for query, or None if the site has no template"""
+        if not self.search_url or not query:
+            return None
+        return self.search_url.format(q=quote_plus(query))
+
+
+class SiteRegistry:
+    """
+    Ordered collection of known sites.
+
+    Order matters: when an instruction mentions keywords of several sites,
+    the parser picks the first site in the table.
+    """
+
+    def __init__(self, sites, default_domain, default_search_selectors=(), default_result_selectors=()):
+        self._sites = {site.domain: site for site in sites}
+        self.default_domain = default_domain
+        self.default_search_selectors = list(default_search_selectors)
+        self.default_result_selectors = list(default_result_selectors)
+        if default_domain not in self._sites:
+            raise ValueError(f"Default site '{default_domain}' is not in the site table")
+
+    @classmethod
+    def from_file(cls, path=SITES_PATH):
+        """Load the site table from a JSON file"""
+        with open(path) as f:
+            data = json.load(f)
+
+        default_selectors = data.get('default_search_selectors', [])
+        default_result_selectors = data.get('default_result_selectors', [])
+        sites = []
+        for entry in data['sites']:
+            try:
+                sites.append(Site(
+                    domain=entry['domain'],
+                    base_url=entry.get('base_url', f"https://{entry['domain']}"),
+                    keywords=entry.get('keywords', []),
+                    search_selectors=entry.get('search_selectors') or default_selectors,
+                    search_url=entry.get('search_url'),
+                    block_resources=entry.get('block_resources'),
+                    result_selectors=entry.get('result_selectors') or default_result_selectors,
+                    cache_ttl=entry.get('cache_ttl'),
+                ))
+            except KeyError as e:
+                raise ValueError(f"Site entry in {path} is missing {e}: {entry}") from None
+
+        logger.info(f"Loaded {len(sites)} sites from {path}")
+        return cls(sites, data.get('default_site', 'google.com'), default_selectors, default_result_selectors)
+
+    def __iter__(self):
+        return iter(self._sites.values())
+
+    def __contains__(self, domain):
+        return domain in self._sites
+
+    def get(self, domain):
+        """Site for domain; unknown domains get a generic entry with default selectors"""
+        site = self._sites.get(domain)
+        if site is None:
+            site = Site(
+                domain, f"https://{domain}",
+                search_selectors=self.default_search_selectors, result_selectors=self.default_result_selectors
+            )
+        return site
+
+    def keyword_table(self):
+        """Ordered mapping of domain -> keywords for the instruction parser"""
+        return {site.domain: site.keywords for site in self._sites.values()}
+
+
+# Loaded once at import; restart the daemon to pick up edits to the table
+SITES = SiteRegistry.from_file()
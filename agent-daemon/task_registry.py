@@ -0,0 +1,523 @@
+"""
+Task registry for the Orbit Agent Server
+Tracks browser tasks by ID and runs them from a bounded queue with a concurrency limit
+"""
+
+import asyncio
+import contextvars
+import itertools
+import logging
+import math
+import os
+import time
+import uuid
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+TASK_CONCURRENCY = int(os.environ.get('AGENT_TASK_CONCURRENCY', os.environ.get('AGENT_BROWSER_POOL_SIZE', '4')))
+TASK_QUEUE_SIZE = int(os.environ.get('AGENT_TASK_QUEUE_SIZE', '16'))
+TASK_HISTORY_SIZE = int(os.environ.get('AGENT_TASK_HISTORY_SIZE', '500'))
+# Seconds after a task succeeds during which an identical submission reuses its result
+COALESCE_WINDOW = float(os.environ.get('AGENT_COALESCE_WINDOW', '2'))
+
+QUEUED = 'queued'
+RUNNING = 'running'
+SUCCEEDED = 'succeeded'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+
+FINISHED_STATES = (SUCCEEDED, FAILED, CANCELLED)
+
+# Task priorities, most urgent first: what the user just asked for, then work nobody is waiting on
+INTERACTIVE = 'interactive'
+BACKGROUND = 'background'
+PRIORITIES = (INTERACTIVE, BACKGROUND)
+
+# Progress events that end a task's event stream
+TERMINAL_EVENTS = ('done', 'error', 'cancelled')
+
+# Record of the task running in the current asyncio context, for report_progress
+_current_record = contextvars.ContextVar('current_task_record', default=None)
+
+
+def current_task():
+    """Record of the task running in the current context, or None outside a task"""
+    return _current_record.get()
+
+
+def report_progress(event, **data):
+    """Emit a progress event for the task running in the current context, if any"""
+    record = _current_record.get()
+    if record is not None:
+        record.emit(event, **data)
+
+
+class QueueFullError(Exception):
+    """Raised when a task is rejected because the work queue is full"""
+
+    def __init__(self, retry_after):
+        super().__init__(f"Task queue is full, retry after {retry_after}s")
+        self.retry_after = retry_after
+
+
+class TaskRecord:
+    """State and outcome of one submitted task"""
+
+    def __init__(self, task_id, func, args, metadata, key=None, session=None, priority=INTERACTIVE):
+        self.task_id = task_id
+        self.func = func
+        self.args = args
+        self.metadata = metadata
+        self.key = key
+        self.priority = priority
+        # Client sessions waiting on this task; a newer command from the only one supersedes it
+        self.sessions = {session} if session else set()
+        # Later identical submissions that attached to this task instead of running
+        self.coalesced = 0
+        self.order = None
+        self.cancel_reason = None
+        # Set when a running background task is stopped to make room and should be queued again
+        self.preempted = False
+        # Task IDs of the sub-tasks a group record tracks
+        self.children = None
+        self.status = QUEUED
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.handle = None
+        self.events = []
+        self._subscribers = []
+
+    @property
+    def finished(self):
+        return self.status in FINISHED_STATES
+
+    def emit(self, event, **data):
+        """Append a timestamped progress event and push it to subscribers"""
+        entry = {
+            "task_id": self.task_id,
+            "event": event,
+            "elapsed_ms": round((time.time() - self.created_at) * 1000, 1),
+            **data,
+        }
+        self.events.append(entry)
+        for callback in list(self._subscribers):
+            try:
+                callback(entry)
+            except Exception as e:
+                logger.error(f"Progress subscriber for task {self.task_id} failed: {e}")
+
+    def subscribe(self, callback):
+        """Call `callback(event)` for every past and future progress event"""
+        self._subscribers.append(callback)
+        for entry in list(self.events):
+            callback(entry)
+
+    def unsubscribe(self, callback):
+        if callback in self._subscribers:
+            self._subscribers.remove(callback)
+
+    async def wait(self, timeout=None):
+        """Wait for the task to finish; returns False if it is still going after timeout seconds"""
+        if self.finished:
+            return True
+        finished = asyncio.get_running_loop().create_future()
+
+        def on_event(entry):
+            if entry['event'] in TERMINAL_EVENTS and not finished.done():
+                finished.set_result(None)
+
+        self.subscribe(on_event)
+        try:
+            await asyncio.wait_for(finished, timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            self.unsubscribe(on_event)
+
+    def to_dict(self):
+        """JSON-friendly view of the task"""
+        duration = None
+        if self.started_at is not None:
+            duration = round((self.finished_at or time.time()) - self.started_at, 3)
+        return {
+            "task_id": self.task_id,
+            "status": self.status,
+            "priority": self.priority,
+            "metadata": self.metadata,
+            "result": self.result,
+            "error": self.error,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "duration": duration,
+            "coalesced": self.coalesced,
+            "children": self.children,
+            "events": self.events,
+        }
+
+
+class TaskRegistry:
+    """
+    Runs submitted coroutines on a fixed set of workers fed by a bounded queue.
+
+    Submissions beyond the queue bound are rejected immediately with a
+    Retry-After estimate, so bursts are shed instead of piling up browser work.
+    Finished records are kept for status lookups up to `history_size`.
+
+    Submissions given a `key` are single-flight: while a task with the same
+    key is queued or running, or within `coalesce_window` seconds of it
+    succeeding, the existing record is returned instead of queueing new work.
+    Coalesced submitters share that one task, including its cancellation,
+    and an interactive duplicate raises a background task to its priority.
+
+    Interactive tasks are taken from the queue before background ones. A new
+    interactive task from a client session cancels that session's older
+    tasks, since the user has moved on, and if every worker is busy it
+    preempts a running background task, which goes back to the queue.
+
+    A group record tracks several already-submitted tasks as one: it never
+    occupies a worker, reports each sub-task as it finishes and completes
+    with a merged result once all of them have.
+    """
+
+    def __init__(self, concurrency=TASK_CONCURRENCY, queue_size=TASK_QUEUE_SIZE, history_size=TASK_HISTORY_SIZE,
+                 coalesce_window=COALESCE_WINDOW):
+        self.concurrency = concurrency
+        self.queue_size = queue_size
+        self.history_size = history_size
+        self.coalesce_window = coalesce_window
+        # (priority rank, submission order, record): interactive first, then FIFO. Entries of
+        # cancelled or promoted tasks stay until a worker skips them, so the heap itself is
+        # unbounded and `queue_size` limits the live queued records counted in _queued
+        self._queue = asyncio.PriorityQueue()
+        self._queued = 0
+        self._order = itertools.count()
+        self._records = OrderedDict()
+        # key -> latest record submitted with that key
+        self._by_key = {}
+        self.coalesced = 0
+        self.superseded = 0
+        self.preemptions = 0
+        self._workers = []
+        self._groups = set()
+        self._running = 0
+        self._closing = False
+        # Exponential moving average of task duration, used for Retry-After
+        self._avg_duration = None
+
+    def _ensure_workers(self):
+        """Start worker coroutines on first use, once an event loop is running"""
+        if self._workers:
+            return
+        for index in range(self.concurrency):
+            self._workers.append(asyncio.create_task(self._worker(), name=f"task-worker-{index}"))
+
+    def retry_after(self):
+        """Estimate seconds until a queue slot frees up"""
+        avg = self._avg_duration or 5.0
+        backlog = self._queued + self._running
+        return max(1, math.ceil(avg * backlog / max(1, self.concurrency * 2)))
+
+    def submit(self, func, *args, metadata=None, key=None, reuse_finished=True, session=None, priority=INTERACTIVE):
+        """
+        Queue `func(*args)` and return its TaskRecord, or raise QueueFullError.
+
+        When `key` matches a task still in flight or one that succeeded within
+        the coalesce window, that task's record is returned instead; with
+        `reuse_finished` false only a task still in flight is shared. Callers
+        must only share a key between submissions whose results are
+        interchangeable.
+
+        An interactive submission with a `session` supersedes that session's
+        unfinished tasks once it is queued.
+        """
+        self._ensure_workers()
+        if priority not in PRIORITIES:
+            raise ValueError(f"Unknown task priority: {priority}")
+        if key is not None:
+            existing = self.find_coalescable(key, reuse_finished)
+            if existing is not None:
+                existing.coalesced += 1
+                self.coalesced += 1
+                logger.info(f"Coalesced duplicate submission into task {existing.task_id}")
+                if session:
+                    existing.sessions.add(session)
+                    if priority == INTERACTIVE:
+                        self._supersede(session, existing)
+                if PRIORITIES.index(priority) < PRIORITIES.index(existing.priority):
+                    self._promote(existing, priority)
+                return existing
+
+        record = TaskRecord(uuid.uuid4().hex, func, args, metadata or {}, key=key, session=session, priority=priority)
+        record.order = next(self._order)
+        try:
+            self._enqueue(record)
+        except asyncio.QueueFull:
+            raise QueueFullError(self.retry_after()) from None
+
+        if key is not None:
+            self._by_key[key] = record
+        self._records[record.task_id] = record
+        self._evict_history()
+        record.emit('queued', position=self._queued, priority=priority)
+        logger.info(f"Queued {priority} task {record.task_id} ({self._queued} waiting, {self._running} running)")
+
+        if priority == INTERACTIVE:
+            if session:
+                self._supersede(session, record)
+            self._preempt_background()
+        return record
+
+    def submit_group(self, children, merge, metadata=None, session=None):
+        """
+        Track submitted `children` as one task and return its record.
+
+        Each finished child is reported as a 'partial' event. When all are
+        done the group finishes with `merge(children)` as its result: it
+        succeeds if any child succeeded and fails otherwise. Cancelling the
+        group cancels the children no other submission shares. A `session` supersedes that session's
+        older tasks as an interactive submission would.
+        """
+        self._ensure_workers()
+        group = TaskRecord(uuid.uuid4().hex, None, (), metadata or {}, session=session)
+        group.children = [child.task_id for child in children]
+        self._records[group.task_id] = group
+        self._evict_history()
+        group.emit('queued', children=group.children)
+        group.status = RUNNING
+        group.started_at = time.time()
+        group.emit('started')
+        group.handle = asyncio.create_task(self._run_group(group, children, merge))
+        self._groups.add(group.handle)
+        group.handle.add_done_callback(self._groups.discard)
+        if session:
+            self._supersede(session, group)
+        return group
+
+    async def _run_group(self, group, children, merge):
+        waiters = {asyncio.create_task(child.wait()): child for child in children}
+        try:
+            pending = set(waiters)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for waiter in done:
+                    child = waiters[waiter]
+                    group.emit(
+                        'partial', child_task_id=child.task_id, status=child.status,
+                        result=child.result, error=child.error, metadata=child.metadata
+                    )
+            result = merge(children)
+        except asyncio.CancelledError:
+            for waiter in waiters:
+                waiter.cancel()
+            for child in children:
+                # A child other clients coalesced into keeps running for them
+                if child.coalesced or child.sessions:
+                    continue
+                self.cancel(child.task_id, reason=f"Group {group.task_id} was cancelled")
+            self._finish(group, CANCELLED, error=group.cancel_reason or "Cancelled while running")
+            group.emit('cancelled', error=group.error)
+            return
+        except Exception as e:
+            logger.error(f"Merging results of group {group.task_id} failed: {e}")
+            self._finish(group, FAILED, error=str(e))
+            group.emit('error', error=group.error)
+            return
+        finally:
+            group.handle = None
+
+        if any(child.status == SUCCEEDED for child in children):
+            self._finish(group, SUCCEEDED, result=result)
+            group.emit('done', result=result)
+        else:
+            self._finish(group, FAILED, result=result, error=f"All {len(children)} sub-tasks failed")
+            group.emit('error', error=group.error, result=result)
+
+    def _enqueue(self, record):
+        if self._queued >= self.queue_size:
+            raise asyncio.QueueFull
+        self._queue.put_nowait((PRIORITIES.index(record.priority), record.order, record))
+        self._queued += 1
+
+    def _promote(self, record, priority):
+        """Raise a shared task to the priority of a more urgent submission that coalesced into it"""
+        if record.status == QUEUED:
+            # Enqueue again at the new rank; the worker skips the old entry when it comes up.
+            # Still one live queued task, so _queued is unchanged
+            self._queue.put_nowait((PRIORITIES.index(priority), record.order, record))
+        # A running task at interactive priority is also no longer preempted
+        record.priority = priority
+        logger.info(f"Promoted task {record.task_id} to {priority} priority")
+        if record.status == QUEUED and priority == INTERACTIVE:
+            self._preempt_background()
+
+    def _supersede(self, session, newer):
+        """Cancel tasks only `session` is waiting on, now that it has sent `newer`"""
+        for record in list(self._records.values()):
+            if record is newer or record.finished or record.sessions != {session}:
+                continue
+            self.superseded += 1
+            logger.info(f"Task {record.task_id} superseded by {newer.task_id} from the same session")
+            self.cancel(record.task_id, reason=f"Superseded by task {newer.task_id}")
+
+    def _preempt_background(self):
+        """Free a worker for a waiting interactive task by requeueing the newest running background task"""
+        if self._running < self.concurrency:
+            return
+        running = [
+            record for record in self._records.values()
+            if record.status == RUNNING and record.priority == BACKGROUND and not record.preempted
+            and record.handle is not None
+        ]
+        if not running:
+            return
+        victim = max(running, key=lambda record: record.started_at)
+        victim.preempted = True
+        self.preemptions += 1
+        logger.info(f"Preempting background task {victim.task_id} for an interactive task")
+        victim.handle.cancel()
+
+    def get(self, task_id):
+        """Look up a task record by ID"""
+        return self._records.get(task_id)
+
+    def find_coalescable(self, key, reuse_finished=True):
+        """In-flight or just-succeeded task submitted with `key`, or None"""
+        record = self._by_key.get(key)
+        if record is None:
+            return None
+        if not record.finished:
+            return record
+        if record.status == SUCCEEDED and time.time() - record.finished_at <= self.coalesce_window:
+            return record if reuse_finished else None
+        del self._by_key[key]
+        return None
+
+    def cancel(self, task_id, reason=None):
+        """Cancel a queued or running task; returns the record or None if unknown"""
+        record = self._records.get(task_id)
+        if record is None or record.finished:
+            return record
+
+        record.cancel_reason = reason
+        # A cancel wins over a pending preemption: the task must not be requeued
+        record.preempted = False
+        if record.status == QUEUED:
+            # The worker skips its entry when it reaches the front of the queue
+            self._queued -= 1
+            self._finish(record, CANCELLED, error=reason or "Cancelled before start")
+            record.emit('cancelled', error=record.error)
+        elif record.handle is not None:
+            # Aborts whatever the task is awaiting (navigation, selector wait) and unwinds its page lease
+            record.handle.cancel()
+        return record
+
+    def _finish(self, record, status, result=None, error=None):
+        record.status = status
+        record.result = result
+        record.error = error
+        record.finished_at = time.time()
+
+    def _evict_history(self):
+        """Drop the oldest finished records beyond the history bound"""
+        excess = len(self._records) - self.history_size
+        if excess <= 0:
+            return
+        for task_id in [tid for tid, rec in self._records.items() if rec.finished][:excess]:
+            record = self._records.pop(task_id)
+            if record.key is not None and self._by_key.get(record.key) is record:
+                del self._by_key[record.key]
+
+    def _record_duration(self, duration):
+        if self._avg_duration is None:
+            self._avg_duration = duration
+        else:
+            self._avg_duration = 0.8 * self._avg_duration + 0.2 * duration
+
+    async def _worker(self):
+        while True:
+            rank, _, record = await self._queue.get()
+            try:
+                # A promoted task leaves its old entry behind at the lower rank
+                if record.status == QUEUED and rank == PRIORITIES.index(record.priority):
+                    self._queued -= 1
+                    await self._run(record)
+            finally:
+                self._queue.task_done()
+
+    async def _run(self, record):
+        record.status = RUNNING
+        record.started_at = time.time()
+        record.emit('started')
+        # Run in a child task so cancelling one record never kills its worker
+        record.handle = asyncio.create_task(self._invoke(record))
+        self._running += 1
+        try:
+            result = await record.handle
+            self._finish(record, SUCCEEDED, result=result)
+            record.emit('done', result=result)
+        except asyncio.CancelledError:
+            if self._closing:
+                self._finish(record, CANCELLED, error="Cancelled while running")
+                record.emit('cancelled', error=record.error)
+                raise
+            if record.preempted and self._requeue(record):
+                return
+            self._finish(record, CANCELLED, error=record.cancel_reason or "Cancelled while running")
+            record.emit('cancelled', error=record.error)
+        except Exception as e:
+            logger.error(f"Task {record.task_id} failed: {e}")
+            self._finish(record, FAILED, error=str(e))
+            record.emit('error', error=record.error)
+        finally:
+            self._running -= 1
+            record.handle = None
+            if record.finished:
+                self._record_duration(record.finished_at - record.started_at)
+
+    def _requeue(self, record):
+        """Put a preempted task back in line under its original order; False if the queue is full"""
+        record.preempted = False
+        try:
+            self._enqueue(record)
+        except asyncio.QueueFull:
+            return False
+        record.status = QUEUED
+        record.started_at = None
+        record.emit('preempted', position=self._queued)
+        return True
+
+    async def _invoke(self, record):
+        # Runs inside the child task, so the context variable is private to this task
+        _current_record.set(record)
+        return await record.func(*record.args)
+
+    def stats(self):
+        """Snapshot of queue depth and concurrency"""
+        return {
+            "concurrency": self.concurrency,
+            "running": self._running,
+            "queued": self._queued,
+            "queue_size": self.queue_size,
+            "tracked": len(self._records),
+            "coalesced": self.coalesced,
+            "superseded": self.superseded,
+            "preemptions": self.preemptions,
+        }
+
+    async def close(self):
+        """Cancel workers and any task still running"""
+        self._closing = True
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        groups = list(self._groups)
+        for group in groups:
+            group.cancel()
+        await asyncio.gather(*groups, return_exceptions=True)
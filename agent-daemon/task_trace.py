@@ -0,0 +1,330 @@
+"""
+Per-task performance traces for the Orbit Agent Server
+Records a task's stage timeline, Chromium metrics, network timings, debug
+screenshots and optionally a Playwright trace, kept in a size-bounded ring
+buffer on disk
+"""
+
+import asyncio
+import contextvars
+import json
+import logging
+import os
+import shutil
+import time
+from contextlib import asynccontextmanager, contextmanager
+
+from metrics import STAGE_LATENCY
+
+logger = logging.getLogger(__name__)
+
+TRACE_DIR = os.environ.get(
+    'AGENT_TRACE_DIR',
+    os.path.join(os.path.expanduser('~'), '.orbit-agent', 'traces')
+)
+TRACE_MAX_MB = float(os.environ.get('AGENT_TRACE_MAX_MB', '200'))
+TRACE_MAX_COUNT = int(os.environ.get('AGENT_TRACE_MAX_COUNT', '100'))
+# Network entries kept per trace; heavy pages can issue hundreds of requests
+MAX_NETWORK_ENTRIES = 500
+
+TRACE_FILE = 'trace.json'
+PLAYWRIGHT_TRACE_FILE = 'playwright-trace.zip'
+
+# Trace of the task running in the current asyncio context, if any
+_current_trace = contextvars.ContextVar('current_task_trace', default=None)
+
+
+def observe_stage(stage, site, seconds):
+    """Record a stage duration in the latency histogram and the current task's trace"""
+    STAGE_LATENCY.observe(seconds, stage, site)
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.add_stage(stage, site, seconds)
+
+
+@contextmanager
+def timed_stage(stage, site):
+    """Time the enclosed block as one automation stage"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_stage(stage, site, time.perf_counter() - start)
+
+
+def capture_screenshot(page, label):
+    """Screenshot the page in the background for the current task's trace"""
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.add_screenshot(page, label)
+
+
+class TaskTrace:
+    """
+    Diagnostics gathered while one task runs.
+
+    Every task gets one: stage timings and failure screenshots are cheap and
+    always collected. Network timings, Chromium metrics and the Playwright
+    trace archive are only recorded when `enabled`, and only traces that are
+    enabled or hold a screenshot are saved.
+    """
+
+    def __init__(self, task_id, mode=None):
+        self.task_id = task_id
+        self.mode = mode
+        self.created_at = time.time()
+        self._start = time.perf_counter()
+        self.stages = []
+        self.network = []
+        self.network_dropped = 0
+        self.chromium_metrics = None
+        self.playwright_trace = None
+        self.screenshots = {}
+        self._pending = set()
+        self._cdp = None
+        self._context = None
+        self._scope = None
+
+    @property
+    def enabled(self):
+        return self.mode is not None
+
+    @property
+    def worth_saving(self):
+        return self.enabled or bool(self.screenshots) or bool(self._pending)
+
+    def _elapsed_ms(self):
+        return round((time.perf_counter() - self._start) * 1000, 1)
+
+    def add_stage(self, stage, site, seconds):
+        duration_ms = round(seconds * 1000, 1)
+        self.stages.append({
+            "stage": stage,
+            "site": site,
+            "started_ms": round(self._elapsed_ms() - duration_ms, 1),
+            "duration_ms": duration_ms,
+        })
+
+    def add_screenshot(self, page, label):
+        name = f"{len(self.screenshots) + len(self._pending) + 1:02d}-{label}.png"
+
+        async def take():
+            try:
+                self.screenshots[name] = await page.screenshot(type='png')
+            except Exception as e:
+                logger.debug(f"Screenshot {name} for task {self.task_id} failed: {e}")
+
+        task = asyncio.create_task(take())
+        self._pending.add(task)
+        task.add_done_callback(self._pending.discard)
+
+    def _on_request_finished(self, request):
+        self._add_request(request, None)
+
+    def _on_request_failed(self, request):
+        self._add_request(request, request.failure)
+
+    def _add_request(self, request, failure):
+        if len(self.network) >= MAX_NETWORK_ENTRIES:
+            self.network_dropped += 1
+            return
+        timing = request.timing
+        self.network.append({
+            "url": request.url,
+            "method": request.method,
+            "resource_type": request.resource_type,
+            "started_ms": round(timing['startTime'] - self.created_at * 1000, 1) if timing.get('startTime') else None,
+            "duration_ms": round(timing['responseEnd'], 1) if timing.get('responseEnd', -1) >= 0 else None,
+            "timing": timing,
+            "failure": failure,
+        })
+
+    async def _start_recording(self, page, store, scope):
+        context = page.context
+        self._context = context
+        self._scope = scope
+        scope.on('requestfinished', self._on_request_finished)
+        scope.on('requestfailed', self._on_request_failed)
+        try:
+            self._cdp = await context.new_cdp_session(page)
+            await self._cdp.send('Performance.enable')
+        except Exception as e:
+            logger.debug(f"Chromium metrics unavailable for task {self.task_id}: {e}")
+            self._cdp = None
+        if self.mode == 'full':
+            try:
+                await context.tracing.start(screenshots=True, snapshots=True)
+                self.playwright_trace = store.file_path(self.task_id, PLAYWRIGHT_TRACE_FILE, create=True)
+            except Exception as e:
+                logger.warning(f"Could not start Playwright tracing for task {self.task_id}: {e}")
+
+    async def _stop_recording(self):
+        context = self._context
+        self._scope.remove_listener('requestfinished', self._on_request_finished)
+        self._scope.remove_listener('requestfailed', self._on_request_failed)
+        if self._cdp is not None:
+            try:
+                response = await self._cdp.send('Performance.getMetrics')
+                self.chromium_metrics = {metric['name']: metric['value'] for metric in response['metrics']}
+                await self._cdp.detach()
+            except Exception as e:
+                logger.debug(f"Could not read Chromium metrics for task {self.task_id}: {e}")
+        if self.playwright_trace:
+            try:
+                await context.tracing.stop(path=self.playwright_trace)
+            except Exception as e:
+                logger.warning(f"Could not save Playwright trace for task {self.task_id}: {e}")
+                self.playwright_trace = None
+
+    @asynccontextmanager
+    async def recording(self, page, store, scope=None):
+        """
+        Collect network timings, Chromium metrics and the Playwright trace while the block runs.
+
+        Requests are observed on `scope`, the task's context by default; pass
+        the page when the context is shared with other tasks.
+        """
+        if not self.enabled:
+            yield self
+            return
+        await self._start_recording(page, store, scope or page.context)
+        try:
+            yield self
+        finally:
+            await self._stop_recording()
+
+    def activate(self):
+        """Make this the trace that stage timings and screenshots in this context report to"""
+        _current_trace.set(self)
+
+    async def wait_for_screenshots(self, timeout=10):
+        if self._pending:
+            await asyncio.wait(list(self._pending), timeout=timeout)
+
+    def to_dict(self, record=None, result=None):
+        """JSON document saved as trace.json"""
+        data = {
+            "task_id": self.task_id,
+            "mode": self.mode,
+            "created_at": self.created_at,
+            "stages": self.stages,
+            "network": self.network,
+            "network_dropped": self.network_dropped,
+            "chromium_metrics": self.chromium_metrics,
+            "screenshots": sorted(self.screenshots),
+            "playwright_trace": PLAYWRIGHT_TRACE_FILE if self.playwright_trace else None,
+            "result": result,
+        }
+        if record is not None:
+            data.update({
+                "status": record.status,
+                "error": record.error,
+                "metadata": record.metadata,
+                "duration": record.to_dict()["duration"],
+                # Progress events form the task's step timeline
+                "timeline": record.events,
+            })
+        return data
+
+
+class TraceStore:
+    """
+    Ring buffer of saved traces, one directory per task.
+
+    Oldest traces are deleted once there are more than `max_count` of them
+    or they take more than `max_mb` on disk. Saving happens in background
+    tasks so a traced task finishes as fast as an untraced one.
+    """
+
+    def __init__(self, root=TRACE_DIR, max_mb=TRACE_MAX_MB, max_count=TRACE_MAX_COUNT):
+        self.root = root
+        self.max_bytes = max_mb * 1024 * 1024
+        self.max_count = max_count
+        self._pending = set()
+
+    def file_path(self, task_id, name, create=False):
+        """Path of one file in a task's trace directory"""
+        directory = os.path.join(self.root, task_id)
+        if create:
+            os.makedirs(directory, exist_ok=True)
+        return os.path.join(directory, name)
+
+    def save_later(self, trace, record, result=None):
+        """Write the trace once its task has finished and its screenshots are in, without blocking"""
+        task = asyncio.create_task(self._save(trace, record, result))
+        self._pending.add(task)
+        task.add_done_callback(self._pending.discard)
+
+    async def _save(self, trace, record, result):
+        try:
+            await trace.wait_for_screenshots()
+            if not trace.worth_saving:
+                return
+            if record is not None:
+                # Let the registry record the terminal event and status first
+                await record.wait(timeout=5)
+            await asyncio.to_thread(self._write, trace, trace.to_dict(record, result))
+        except Exception as e:
+            logger.warning(f"Could not save trace for task {trace.task_id}: {e}")
+
+    def _write(self, trace, document):
+        with open(self.file_path(trace.task_id, TRACE_FILE, create=True), 'w') as f:
+            json.dump(document, f, default=str)
+        for name, png in trace.screenshots.items():
+            with open(self.file_path(trace.task_id, name), 'wb') as f:
+                f.write(png)
+        logger.info(f"Saved trace for task {trace.task_id}")
+        self._evict()
+
+    def _entries(self):
+        """(mtime, task_id, size in bytes) for every saved trace, oldest first"""
+        entries = []
+        if not os.path.isdir(self.root):
+            return entries
+        for task_id in os.listdir(self.root):
+            directory = os.path.join(self.root, task_id)
+            if not os.path.isfile(os.path.join(directory, TRACE_FILE)):
+                continue
+            size = 0
+            for name in os.listdir(directory):
+                try:
+                    size += os.path.getsize(os.path.join(directory, name))
+                except OSError:
+                    continue
+            entries.append((os.path.getmtime(os.path.join(directory, TRACE_FILE)), task_id, size))
+        return sorted(entries)
+
+    def _evict(self):
+        entries = self._entries()
+        total = sum(size for _, _, size in entries)
+        while entries and (len(entries) > self.max_count or total > self.max_bytes):
+            _, task_id, size = entries.pop(0)
+            shutil.rmtree(os.path.join(self.root, task_id), ignore_errors=True)
+            total -= size
+
+    def list(self):
+        """Saved traces, newest first"""
+        return [
+            {"task_id": task_id, "saved_at": mtime, "size_bytes": size, "url": f"/agent/traces/{task_id}"}
+            for mtime, task_id, size in reversed(self._entries())
+        ]
+
+    def get(self, task_id):
+        """Saved trace document for a task, or None"""
+        path = self.file_path(task_id, TRACE_FILE)
+        if not task_id.isalnum() or not os.path.isfile(path):
+            return None
+        with open(path) as f:
+            return json.load(f)
+
+    def artifact(self, task_id, name):
+        """Path of a screenshot or Playwright trace saved with a task, or None"""
+        directory = os.path.join(self.root, task_id)
+        if not task_id.isalnum() or not os.path.isdir(directory) or name not in os.listdir(directory):
+            return None
+        return os.path.join(directory, name)
+
+    async def close(self):
+        """Finish writing traces still being saved"""
+        if self._pending:
+            await asyncio.wait(list(self._pending), timeout=10)
@@ -0,0 +1,62 @@
+"""
+Tests for splitting compound instructions into per-site, per-query tasks.
+"""
+
+import pytest
+
+from instruction_parser import parse_fan_out
+
+
+@pytest.mark.parametrize('instruction, expected', [
+    # A list of sites after a preposition, returned in site-table order
+    ('find headphones on amazon and ebay',
+     [('amazon.com', 'headphones'), ('ebay.com', 'headphones')]),
+    ('Find headphones on Amazon, eBay or Reddit',
+     [('amazon.com', 'headphones'), ('ebay.com', 'headphones'), ('reddit.com', 'headphones')]),
+    # compare
+    ('compare airpods and galaxy buds on amazon',
+     [('amazon.com', 'airpods'), ('amazon.com', 'galaxy buds')]),
+    ('compare the price of airpods with galaxy buds',
+     [('google.com', 'airpods'), ('google.com', 'galaxy buds')]),
+    # vs, with the site either before or after the queries
+    ('search google for cats vs dogs',
+     [('google.com', 'cats'), ('google.com', 'dogs')]),
+    ('search for cats versus dogs on youtube',
+     [('youtube.com', 'cats'), ('youtube.com', 'dogs')]),
+    # ';' separates queries once something else makes the instruction compound
+    ('find cats; dogs on amazon and ebay',
+     [('amazon.com', 'cats'), ('amazon.com', 'dogs'), ('ebay.com', 'cats'), ('ebay.com', 'dogs')]),
+    ('compare iphone vs pixel; galaxy',
+     [('google.com', 'iphone'), ('google.com', 'pixel'), ('google.com', 'galaxy')]),
+])
+def test_compound_instructions_fan_out(instruction, expected):
+    tasks = parse_fan_out(instruction, max_tasks=10)
+    assert [(task['website'], task['search_query']) for task in tasks] == expected
+    assert all(task['original_instruction'] == instruction for task in tasks)
+
+
+@pytest.mark.parametrize('instruction', [
+    # One site and one query
+    'find shoes on amazon',
+    'search google for cats',
+    # ';' alone is not enough, and one before an action verb starts a follow-up step
+    'search for cats; dogs on youtube',
+    'find headphones on amazon and ebay; then click the first result',
+    # The queries would be site names, or words the site list used to join
+    'search for amazon vs ebay',
+    'search amazon for headphones on ebay and reddit',
+    'go to youtube; click first result',
+])
+def test_single_task_instructions_return_none(instruction):
+    assert parse_fan_out(instruction) is None
+
+
+def test_compare_defaults_to_shopping_and_keeps_actions():
+    tasks = parse_fan_out('compare airpods and galaxy buds on amazon and click the first result')
+    assert {task['task_type'] for task in tasks} == {'shopping'}
+    assert all(task['actions'] == ['click_first_result'] for task in tasks)
+
+
+def test_fan_out_is_capped_at_max_tasks():
+    tasks = parse_fan_out('find cats; dogs on amazon and ebay', max_tasks=3)
+    assert len(tasks) == 3
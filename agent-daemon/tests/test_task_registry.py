@@ -0,0 +1,180 @@
+"""
+Tests for the task registry's scheduling: priorities, supersession,
+coalescing and groups. Tasks are plain coroutines, no browser needed.
+"""
+
+import asyncio
+
+import pytest
+
+from task_registry import BACKGROUND, CANCELLED, INTERACTIVE, SUCCEEDED, QueueFullError, TaskRegistry
+
+
+def run(scenario, concurrency, queue_size=10):
+    """Run scenario(registry) on a fresh registry, always closing it so a failure can't hang the loop"""
+    async def main():
+        registry = TaskRegistry(concurrency=concurrency, queue_size=queue_size)
+        try:
+            return await asyncio.wait_for(scenario(registry), timeout=5)
+        finally:
+            await registry.close()
+
+    return asyncio.run(main())
+
+
+async def job(log, name, gate=None):
+    if gate is not None:
+        await gate.wait()
+    log.append(name)
+    return name
+
+
+async def settle():
+    """Let workers pick up and finish whatever is ready"""
+    for _ in range(10):
+        await asyncio.sleep(0)
+
+
+def test_interactive_tasks_run_before_background_ones():
+    async def scenario(registry):
+        log, gate = [], asyncio.Event()
+        registry.submit(job, log, 'blocker', gate)
+        await settle()
+        first = registry.submit(job, log, 'bg-1', priority=BACKGROUND)
+        registry.submit(job, log, 'interactive')
+        last = registry.submit(job, log, 'bg-2', priority=BACKGROUND)
+        gate.set()
+        await first.wait()
+        await last.wait()
+        return log
+
+    assert run(scenario, 1) == ['blocker', 'interactive', 'bg-1', 'bg-2']
+
+
+def test_supersede_skips_tasks_shared_with_another_session():
+    async def scenario(registry):
+        log, gate = [], asyncio.Event()
+        shared = registry.submit(job, log, 'shared', gate, key='k', session='s1')
+        assert registry.submit(job, log, 'shared', gate, key='k', session='s2') is shared
+        own = registry.submit(job, log, 'own', gate, session='s1')
+        await settle()
+
+        registry.submit(job, log, 'newer', session='s1')
+        await settle()
+        assert own.status == CANCELLED
+        assert not shared.finished
+        gate.set()
+        await shared.wait()
+        return shared
+
+    assert run(scenario, 2).status == SUCCEEDED
+
+
+def test_interactive_duplicate_promotes_queued_background_task():
+    async def scenario(registry):
+        log, gate = [], asyncio.Event()
+        registry.submit(job, log, 'blocker', gate)
+        await settle()
+        older = registry.submit(job, log, 'older', priority=BACKGROUND, key='older')
+        joined = registry.submit(job, log, 'joined', priority=BACKGROUND, key='joined')
+        assert registry.submit(job, log, 'joined', key='joined') is joined
+        assert joined.priority == INTERACTIVE
+        gate.set()
+        await older.wait()
+        return log
+
+    # The stale background entry of the promoted task is skipped, so it runs once
+    assert run(scenario, 1) == ['blocker', 'joined', 'older']
+
+
+def test_promoted_running_task_is_not_preempted():
+    async def scenario(registry):
+        log, gate = [], asyncio.Event()
+        running = registry.submit(job, log, 'running', gate, priority=BACKGROUND, key='k')
+        await settle()
+        registry.submit(job, log, 'running', gate, key='k')
+        waiting = registry.submit(job, log, 'waiting')
+        await settle()
+        assert registry.preemptions == 0
+        assert not running.finished
+        gate.set()
+        await waiting.wait()
+        return running, log
+
+    running, log = run(scenario, 1)
+    assert running.status == SUCCEEDED
+    assert log == ['running', 'waiting']
+
+
+def test_group_merges_children_and_reports_each():
+    async def scenario(registry):
+        log = []
+        children = [registry.submit(job, log, name) for name in ('a', 'b')]
+        group = registry.submit_group(children, lambda done: [child.result for child in done])
+        await group.wait()
+        return group
+
+    group = run(scenario, 2)
+    assert group.status == SUCCEEDED
+    assert group.result == ['a', 'b']
+    assert [event['event'] for event in group.events].count('partial') == 2
+
+
+def test_group_cancel_spares_children_other_clients_share():
+    async def scenario(registry):
+        log, gate = [], asyncio.Event()
+        private = registry.submit(job, log, 'private', gate)
+        shared = registry.submit(job, log, 'shared', gate, key='k')
+        assert registry.submit(job, log, 'shared', gate, key='k') is shared
+        group = registry.submit_group([private, shared], lambda done: None)
+        await settle()
+
+        registry.cancel(group.task_id)
+        await group.wait()
+        await private.wait()
+        gate.set()
+        await shared.wait()
+        return group, private, shared
+
+    group, private, shared = run(scenario, 2)
+    assert group.status == CANCELLED
+    assert private.status == CANCELLED
+    assert shared.status == SUCCEEDED
+
+
+def test_superseded_tasks_free_their_queue_slots():
+    async def scenario(registry):
+        log, gate = [], asyncio.Event()
+        registry.submit(job, log, 'blocker', gate)
+        await settle()
+        # Each command from the session cancels the queued one before it
+        commands = [registry.submit(job, log, f'command-{n}', session='s') for n in range(4)]
+        assert [command.status for command in commands[:-1]] == [CANCELLED] * 3
+        assert registry.stats()['queued'] == 1
+        registry.submit(job, log, 'other')
+        with pytest.raises(QueueFullError):
+            registry.submit(job, log, 'one too many')
+        gate.set()
+        await commands[-1].wait()
+        return log
+
+    # The blocker is from no session, so only the queued commands were superseded
+    assert run(scenario, 1, queue_size=2)[:2] == ['blocker', 'command-3']
+
+
+def test_cancelled_and_promoted_tasks_do_not_hold_queue_slots():
+    async def scenario(registry):
+        log, gate = [], asyncio.Event()
+        registry.submit(job, log, 'blocker', gate)
+        await settle()
+        registry.cancel(registry.submit(job, log, 'cancelled').task_id)
+        queued = registry.submit(job, log, 'queued', priority=BACKGROUND, key='k')
+        assert registry.submit(job, log, 'queued', key='k') is queued
+        assert registry.stats()['queued'] == 1
+        gate.set()
+        await queued.wait()
+        await settle()
+        assert registry.stats()['queued'] == 0
+        return log
+
+    assert run(scenario, 1, queue_size=1) == ['blocker', 'queued']
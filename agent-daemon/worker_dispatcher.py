@@ -0,0 +1,546 @@
+"""
+Multi-process worker mode for the Orbit Agent Server
+Runs several headless agent daemons and dispatches tasks to the least loaded one
+"""
+
+import asyncio
+import json
+import logging
+import os
+import sys
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+
+import aiohttp
+import uvicorn
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect
+from fastapi.responses import JSONResponse, PlainTextResponse, Response, StreamingResponse
+
+from metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE
+from metrics import Counter, Gauge, MetricsRegistry
+
+logger = logging.getLogger(__name__)
+
+WORKER_COUNT = int(os.environ.get('AGENT_WORKERS', '1'))
+HEALTH_INTERVAL = float(os.environ.get('AGENT_WORKER_HEALTH_INTERVAL', '5'))
+# Upper bound on one forwarded request; covers /agent/run calls that wait for their task
+REQUEST_TIMEOUT = float(os.environ.get('AGENT_WORKER_REQUEST_TIMEOUT', '60'))
+RESTART_BACKOFF_MAX = float(os.environ.get('AGENT_WORKER_RESTART_BACKOFF_MAX', '30'))
+# A worker that stayed up this long is considered stable again and restarts without delay
+STABLE_UPTIME = 60
+STOP_TIMEOUT = 15
+TASK_ROUTES_SIZE = 5000
+# Repeats of a task, or further tasks from a client session, within this many seconds go to
+# the same worker, where duplicates coalesce and a newer command supersedes the older one
+AFFINITY_WINDOW = 30
+
+WORKER_HOST = '127.0.0.1'
+SERVER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'simple_server.py')
+
+
+class WorkerProcess:
+    """One headless agent daemon child process and what the dispatcher knows about it"""
+
+    def __init__(self, index, port):
+        self.index = index
+        self.port = port
+        self.process = None
+        self.started_at = None
+        self.restarts = 0
+        self.last_exit_code = None
+        self.healthy = False
+        # Answered its last health poll, whether or not its browser can run tasks
+        self.responding = False
+        # Healthy but its browser is being relaunched; tried after fully healthy workers
+        self.degraded = False
+        self.health = None
+        self.last_health_at = None
+        # Tasks sent since the last health poll, so bursts spread before the next poll
+        self.dispatched = 0
+
+    @property
+    def url(self):
+        return f"http://{WORKER_HOST}:{self.port}"
+
+    @property
+    def alive(self):
+        return self.process is not None and self.process.returncode is None
+
+    def environment(self):
+        env = dict(os.environ)
+        env['AGENT_WORKERS'] = '1'
+        env['AGENT_WORKER_ID'] = str(self.index)
+        env['AGENT_BROWSER_HEADLESS'] = '1'
+        if env.get('AGENT_RESULT_CACHE_PATH'):
+            # Each worker persists its own cache rather than overwriting a shared file
+            env['AGENT_RESULT_CACHE_PATH'] = f"{env['AGENT_RESULT_CACHE_PATH']}.worker{self.index}"
+        if env.get('AGENT_BROWSER_PROFILE_DIR'):
+            # Chromium locks its profile, so each worker's browser needs its own
+            env['AGENT_BROWSER_PROFILE_DIR'] = os.path.join(env['AGENT_BROWSER_PROFILE_DIR'], f"worker{self.index}")
+        return env
+
+    async def spawn(self):
+        self.healthy = False
+        self.health = None
+        self.dispatched = 0
+        self.process = await asyncio.create_subprocess_exec(
+            sys.executable, SERVER_SCRIPT, '--host', WORKER_HOST, '--port', str(self.port),
+            env=self.environment(),
+            # Own process group: terminal signals reach only the dispatcher, which stops workers in order
+            start_new_session=True,
+        )
+        self.started_at = time.monotonic()
+        logger.info(f"Started worker {self.index} (pid {self.process.pid}) on port {self.port}")
+
+    def load(self):
+        """Fraction of the worker's task capacity in use, including tasks sent since the last poll"""
+        tasks = (self.health or {}).get('tasks', {})
+        busy = tasks.get('running', 0) + tasks.get('queued', 0) + self.dispatched
+        return busy / max(1, tasks.get('concurrency', 1))
+
+    def stats(self):
+        return {
+            "worker": self.index,
+            "pid": self.process.pid if self.process else None,
+            "port": self.port,
+            "alive": self.alive,
+            "healthy": self.healthy,
+            "degraded": self.degraded,
+            "restarts": self.restarts,
+            "last_exit_code": self.last_exit_code,
+            "uptime": round(time.monotonic() - self.started_at, 1) if self.alive else None,
+            "load": round(self.load(), 3),
+            "health": self.health,
+        }
+
+
+class WorkerDispatcher:
+    """
+    Supervises worker processes and routes requests to them.
+
+    Tasks go to the healthy worker with the lowest load, where load is the
+    running plus queued tasks from its last health poll, relative to its
+    concurrency. Workers that exit are restarted with exponential backoff.
+    Task IDs are remembered so status and cancel calls reach the worker that
+    owns the task. A repeated task, or the next task from the same client
+    session, is sent back to the worker that took the last one, so that
+    worker can share the run or supersede the session's stale task.
+    """
+
+    def __init__(self, count=WORKER_COUNT, base_port=4824, health_interval=HEALTH_INTERVAL):
+        self.workers = [WorkerProcess(index, base_port + index) for index in range(count)]
+        self.health_interval = health_interval
+        self.session = None
+        self._task_routes = OrderedDict()
+        # Normalized task text or session ID -> (worker, monotonic time a task was sent)
+        self._affinity = OrderedDict()
+        self._tasks = []
+        self._closing = False
+
+    async def start(self):
+        self.session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=REQUEST_TIMEOUT, sock_connect=2))
+        for worker in self.workers:
+            self._tasks.append(asyncio.create_task(self._supervise(worker), name=f"supervise-worker-{worker.index}"))
+        self._tasks.append(asyncio.create_task(self._health_loop(), name="worker-health"))
+
+    async def _supervise(self, worker):
+        """Keep one worker process running, restarting it when it exits"""
+        failures = 0
+        while not self._closing:
+            try:
+                await worker.spawn()
+            except OSError as e:
+                logger.error(f"Could not start worker {worker.index}: {e}")
+            else:
+                worker.last_exit_code = await worker.process.wait()
+                worker.healthy = False
+                if self._closing:
+                    return
+                if time.monotonic() - worker.started_at >= STABLE_UPTIME:
+                    failures = 0
+                logger.warning(f"Worker {worker.index} exited with code {worker.last_exit_code}; restarting")
+
+            worker.restarts += 1
+            WORKER_RESTARTS.inc(str(worker.index))
+            delay = min(RESTART_BACKOFF_MAX, 2 ** failures - 1)
+            failures += 1
+            if delay:
+                await asyncio.sleep(delay)
+
+    async def _health_loop(self):
+        while True:
+            await asyncio.gather(*(self.poll(worker) for worker in self.workers))
+            await asyncio.sleep(self.health_interval)
+
+    async def poll(self, worker):
+        """Refresh one worker's health and load"""
+        if not worker.alive:
+            worker.healthy = worker.responding = False
+            return
+        try:
+            async with self.session.get(f"{worker.url}/health", timeout=aiohttp.ClientTimeout(total=2)) as response:
+                worker.health = await response.json()
+            # A worker whose browser cannot launch reports 'unhealthy' and gets no tasks until it recovers
+            status = worker.health.get('status')
+            worker.responding = response.status == 200
+            worker.healthy = worker.responding and status != 'unhealthy'
+            worker.degraded = status == 'degraded'
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError):
+            worker.healthy = worker.responding = False
+        worker.last_health_at = time.time()
+        worker.dispatched = 0
+
+    def candidates(self, affinity=()):
+        """Workers to try for a new task: one that recently took a task with the same affinity keys, then least loaded first"""
+        ready = [worker for worker in self.workers if worker.healthy]
+        if not ready:
+            # Nothing has answered a poll yet (e.g. at startup); try whatever is running
+            ready = [worker for worker in self.workers if worker.alive]
+        ordered = sorted(ready, key=lambda worker: (worker.degraded, worker.load(), worker.index))
+
+        for key in affinity:
+            recent = self._affinity.get(key) if key else None
+            if recent and time.monotonic() - recent[1] <= AFFINITY_WINDOW and recent[0] in ordered:
+                ordered.remove(recent[0])
+                ordered.insert(0, recent[0])
+                break
+        return ordered
+
+    def remember_affinity(self, affinity, worker):
+        for key in affinity:
+            if not key:
+                continue
+            self._affinity[key] = (worker, time.monotonic())
+            self._affinity.move_to_end(key)
+        while len(self._affinity) > TASK_ROUTES_SIZE:
+            self._affinity.popitem(last=False)
+
+    def remember(self, task_id, worker):
+        self._task_routes[task_id] = worker
+        while len(self._task_routes) > TASK_ROUTES_SIZE:
+            self._task_routes.popitem(last=False)
+
+    def owner(self, task_id):
+        return self._task_routes.get(task_id)
+
+    async def forward(self, worker, method, path, body=None):
+        """Send one request to a worker; returns (status, headers, JSON body)"""
+        async with self.session.request(method, f"{worker.url}{path}", json=body) as response:
+            return response.status, response.headers, await response.json()
+
+    def stats(self):
+        """Health of every worker plus task totals across them"""
+        workers = [worker.stats() for worker in self.workers]
+        healthy = sum(1 for worker in self.workers if worker.healthy)
+        totals = {}
+        for worker in self.workers:
+            for key, value in (worker.health or {}).get('tasks', {}).items():
+                totals[key] = totals.get(key, 0) + value
+        if healthy == len(self.workers) and not any(worker.degraded for worker in self.workers):
+            status = "healthy"
+        elif healthy:
+            status = "degraded"
+        else:
+            status = "unhealthy"
+        return {"status": status, "healthy_workers": healthy, "workers": workers, "tasks": totals}
+
+    async def close(self):
+        """Stop supervising and shut every worker down, killing stragglers"""
+        self._closing = True
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+        running = [worker.process for worker in self.workers if worker.alive]
+        for process in running:
+            process.terminate()
+        try:
+            await asyncio.wait_for(asyncio.gather(*(process.wait() for process in running)), STOP_TIMEOUT)
+        except asyncio.TimeoutError:
+            for process in running:
+                if process.returncode is None:
+                    process.kill()
+        if self.session is not None:
+            await self.session.close()
+
+
+dispatcher_metrics = MetricsRegistry()
+
+WORKER_RESTARTS = dispatcher_metrics.register(Counter(
+    'agent_worker_restarts_total', 'Worker processes restarted after exiting', labelnames=('worker',)
+))
+
+
+def create_app(dispatcher):
+    """Front FastAPI app that proxies the agent API to the worker processes"""
+
+    @asynccontextmanager
+    async def lifespan(app):
+        await dispatcher.start()
+        yield
+        await dispatcher.close()
+
+    app = FastAPI(title="Orbit Agent Dispatcher", version="1.0.0", lifespan=lifespan)
+
+    dispatcher_metrics.register(Gauge(
+        'agent_workers_configured', 'Worker processes the dispatcher runs', lambda: len(dispatcher.workers)
+    ))
+    dispatcher_metrics.register(Gauge(
+        'agent_workers_healthy', 'Worker processes that passed their last health check',
+        lambda: sum(1 for worker in dispatcher.workers if worker.healthy)
+    ))
+
+    @app.get("/")
+    async def root():
+        return {"status": "Orbit Agent Dispatcher is running"}
+
+    @app.get("/health")
+    async def health():
+        """Aggregated health of all workers; 503 only when none answers, as LLM routing needs no browser"""
+        stats = dispatcher.stats()
+        return JSONResponse(
+            status_code=200 if any(worker.responding for worker in dispatcher.workers) else 503,
+            content={"service": "orbit-agent-dispatcher", **stats}
+        )
+
+    @app.get("/metrics")
+    async def metrics():
+        """Dispatcher metrics; each worker serves its own /metrics on its port"""
+        return PlainTextResponse(dispatcher_metrics.render(), media_type=METRICS_CONTENT_TYPE)
+
+    @app.post("/agent/run")
+    async def run_agent_task(request: dict):
+        """Send the task to the least loaded worker, moving on to the next if it is full"""
+        rejected = None
+        # Same session first, so a new command lands where it can supersede the previous one
+        affinity = (
+            f"session:{request['session']}" if request.get("session") else None,
+            ' '.join(str(request.get("task", "")).lower().split()),
+        )
+        for worker in dispatcher.candidates(affinity):
+            try:
+                worker.dispatched += 1
+                status, headers, body = await dispatcher.forward(worker, 'POST', '/agent/run', request)
+            except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+                logger.warning(f"Worker {worker.index} failed to take a task: {e}")
+                worker.healthy = False
+                continue
+
+            if status == 429:
+                rejected = (headers, body)
+                continue
+            if body.get("task_id"):
+                dispatcher.remember(body["task_id"], worker)
+                dispatcher.remember_affinity(affinity, worker)
+            body["worker"] = worker.index
+            return JSONResponse(status_code=status, content=body)
+
+        if rejected:
+            headers, body = rejected
+            return JSONResponse(status_code=429, headers={"Retry-After": headers.get("Retry-After", "1")}, content=body)
+        return JSONResponse(status_code=503, content={"status": "error", "error": "No agent workers available"})
+
+    @app.post("/agent/run_batch")
+    async def run_agent_batch(request: dict):
+        """Deal the batch's items across the healthy workers and merge their NDJSON streams"""
+        items = request.get("items")
+        if not isinstance(items, list) or not items:
+            return JSONResponse(status_code=400, content={"status": "error", "error": "No batch items provided"})
+        limit = request.get("concurrency")
+        if limit is not None and (isinstance(limit, bool) or not isinstance(limit, int) or limit < 1):
+            return JSONResponse(
+                status_code=400,
+                content={"status": "error", "error": f"Batch concurrency must be a positive integer, got {limit!r}"}
+            )
+        workers = dispatcher.candidates()
+        if not workers:
+            return JSONResponse(status_code=503, content={"status": "error", "error": "No agent workers available"})
+
+        # Each worker gets every Nth item; positions map its local indexes back to the client's
+        shares = [(worker, list(range(offset, len(items), len(workers)))) for offset, worker in enumerate(workers)]
+        shares = [(worker, positions) for worker, positions in shares if positions]
+        return StreamingResponse(
+            stream_batch(request, items, shares), media_type="application/x-ndjson"
+        )
+
+    async def stream_batch(request, items, shares):
+        """Relay each worker's item lines as they arrive, then one summary for the whole batch"""
+        started = time.perf_counter()
+        finished = asyncio.Queue()
+
+        async def relay(worker, positions):
+            reported = set()
+            error = f"Worker {worker.index} did not finish this item"
+            body = {**request, "items": [items[position] for position in positions]}
+            try:
+                worker.dispatched += len(positions)
+                async with dispatcher.session.post(
+                    f"{worker.url}/agent/run_batch", json=body,
+                    timeout=aiohttp.ClientTimeout(total=None, sock_connect=2)
+                ) as response:
+                    if response.status != 200:
+                        error = (await response.json()).get("error", error)
+                        raise ValueError(error)
+                    async for raw in response.content:
+                        line = json.loads(raw)
+                        if line.get("type") != "item":
+                            continue
+                        position = positions[line["index"]]
+                        reported.add(position)
+                        item = items[position]
+                        line["index"] = position
+                        if not (isinstance(item, dict) and "id" in item):
+                            line["id"] = position
+                        if line.get("task_id"):
+                            dispatcher.remember(line["task_id"], worker)
+                        line["worker"] = worker.index
+                        finished.put_nowait(line)
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                logger.warning(f"Worker {worker.index} failed during a batch: {e}")
+                worker.healthy = False
+            except ValueError as e:
+                logger.warning(f"Worker {worker.index} rejected its share of a batch: {e}")
+            # Items the worker never answered still get a line, so the client's count adds up
+            for position in positions:
+                if position not in reported:
+                    item = items[position]
+                    finished.put_nowait({
+                        "type": "item", "index": position,
+                        "id": item["id"] if isinstance(item, dict) and "id" in item else position,
+                        "status": "error", "error": error,
+                        "worker": worker.index,
+                    })
+
+        relays = [asyncio.create_task(relay(worker, positions)) for worker, positions in shares]
+        succeeded = 0
+        try:
+            for _ in items:
+                line = await finished.get()
+                succeeded += line["status"] == "success"
+                yield json.dumps(line) + "\n"
+            yield json.dumps({
+                "type": "summary",
+                "total": len(items),
+                "succeeded": succeeded,
+                "failed": len(items) - succeeded,
+                "duration_ms": round((time.perf_counter() - started) * 1000, 1),
+            }) + "\n"
+        finally:
+            # Dropping the worker connections makes the workers cancel what is left
+            for task in relays:
+                task.cancel()
+            await asyncio.gather(*relays, return_exceptions=True)
+
+    async def forward_task_request(task_id, method, path):
+        """Route a task lookup to its owner, asking every worker if the owner is unknown"""
+        owner = dispatcher.owner(task_id)
+        workers = [owner] if owner else [worker for worker in dispatcher.workers if worker.alive]
+        for worker in workers:
+            try:
+                status, _, body = await dispatcher.forward(worker, method, path)
+            except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+                logger.warning(f"Worker {worker.index} did not answer {path}: {e}")
+                continue
+            if status != 404:
+                dispatcher.remember(task_id, worker)
+                return JSONResponse(status_code=status, content={**body, "worker": worker.index})
+        return JSONResponse(status_code=404, content={"status": "error", "error": f"Unknown task: {task_id}"})
+
+    @app.get("/agent/tasks/{task_id}")
+    async def get_agent_task(task_id: str):
+        return await forward_task_request(task_id, 'GET', f"/agent/tasks/{task_id}")
+
+    @app.post("/agent/tasks/{task_id}/cancel")
+    async def cancel_agent_task(task_id: str):
+        return await forward_task_request(task_id, 'POST', f"/agent/tasks/{task_id}/cancel")
+
+    @app.get("/agent/traces")
+    async def list_traces():
+        """Traces from every worker, newest first"""
+        traces = []
+        for worker in dispatcher.workers:
+            if not worker.alive:
+                continue
+            try:
+                _, _, body = await dispatcher.forward(worker, 'GET', '/agent/traces')
+            except (aiohttp.ClientError, asyncio.TimeoutError, ValueError):
+                continue
+            traces.extend(trace for trace in body["traces"] if trace not in traces)
+        return {"traces": sorted(traces, key=lambda trace: trace["saved_at"], reverse=True)}
+
+    @app.get("/agent/traces/{task_id}")
+    async def get_trace(task_id: str):
+        return await forward_task_request(task_id, 'GET', f"/agent/traces/{task_id}")
+
+    @app.get("/agent/traces/{task_id}/{name}")
+    async def get_trace_artifact(task_id: str, name: str):
+        owner = dispatcher.owner(task_id)
+        workers = [owner] if owner else [worker for worker in dispatcher.workers if worker.alive]
+        for worker in workers:
+            try:
+                async with dispatcher.session.get(f"{worker.url}/agent/traces/{task_id}/{name}") as response:
+                    if response.status == 200:
+                        return Response(content=await response.read(), media_type=response.content_type)
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                continue
+        return JSONResponse(status_code=404, content={"status": "error", "error": f"No {name} for task: {task_id}"})
+
+    @app.websocket("/ws")
+    async def websocket_endpoint(websocket: WebSocket):
+        """Pin each WebSocket connection to the least loaded worker and relay messages both ways"""
+        await websocket.accept()
+        candidates = dispatcher.candidates()
+        if not candidates:
+            await websocket.close(code=1013)
+            return
+        worker = candidates[0]
+
+        async def client_to_worker(upstream):
+            while True:
+                await upstream.send_str(await websocket.receive_text())
+
+        async def worker_to_client(upstream):
+            async for message in upstream:
+                if message.type != aiohttp.WSMsgType.TEXT:
+                    break
+                # Learn task ownership so HTTP status lookups find the right worker
+                if '"accepted"' in message.data:
+                    try:
+                        reply = json.loads(message.data)
+                        if reply.get("type") == "accepted" and reply.get("task_id"):
+                            dispatcher.remember(reply["task_id"], worker)
+                    except ValueError:
+                        pass
+                await websocket.send_text(message.data)
+
+        try:
+            async with dispatcher.session.ws_connect(f"{worker.url}/ws") as upstream:
+                relays = [
+                    asyncio.create_task(client_to_worker(upstream)),
+                    asyncio.create_task(worker_to_client(upstream)),
+                ]
+                try:
+                    await asyncio.wait(relays, return_when=asyncio.FIRST_COMPLETED)
+                finally:
+                    for relay in relays:
+                        relay.cancel()
+                    await asyncio.gather(*relays, return_exceptions=True)
+        except WebSocketDisconnect:
+            pass
+        except aiohttp.ClientError as e:
+            logger.warning(f"Could not relay WebSocket to worker {worker.index}: {e}")
+        finally:
+            try:
+                await websocket.close()
+            except RuntimeError:
+                pass
+
+    return app
+
+
+def run(host, port, workers):
+    """Serve the dispatcher on host:port with worker processes on the following ports"""
+    logger.info(f"Starting Orbit Agent Dispatcher with {workers} headless workers...")
+    dispatcher = WorkerDispatcher(count=workers, base_port=port + 1)
+    uvicorn.run(create_app(dispatcher), host=host, port=port, log_level="info")